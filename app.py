@@ -1,15 +1,9 @@
-import os
 import streamlit as st
 import time
-from urllib.parse import urlparse, parse_qs
-import pandas as pd
-from utils.db import save_user, get_user, save_activities, get_user_activities, get_all_user_ids
-from utils.strava import get_auth_url, exchange_code_for_token, get_activities
-from utils.visualization import (
-    prepare_activity_data,
-    create_weekly_volume_chart,
-    create_weekly_velocity_chart
-)
+# Loads .env once, before any other module reads its settings
+from utils import config
+from utils.db import DatabaseUnavailable, save_user, get_connection_status, get_storage_backend
+from utils import perf
 
 # Page configuration
 st.set_page_config(
@@ -19,6 +13,17 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Serve Prometheus metrics if PERF_METRICS_PORT is set (once per process)
+perf.start_metrics_server()
+
+# Page modules, imported the first time their page is opened
+PAGES = {
+    "Home": "views.home",
+    "Get Data": "views.get_data",
+    "Visualizations": "views.visualizations",
+    "Cohort": "views.cohort",
+}
+
 # Initialize session state
 if 'user_id' not in st.session_state:
     st.session_state.user_id = None
@@ -28,6 +33,11 @@ if 'activities_loaded' not in st.session_state:
     st.session_state.activities_loaded = False
 if 'offline_mode' not in st.session_state:
     st.session_state.offline_mode = False
+if 'show_perf' not in st.session_state:
+    st.session_state.show_perf = perf.is_enabled()
+
+# Time this script run; the performance panel times only its own session's runs
+perf.begin_request(enabled=st.session_state.show_perf)
 
 # Check authentication from URL parameters (after Strava callback)
 current_url = st.experimental_get_query_params()
@@ -35,6 +45,7 @@ if 'code' in current_url and not st.session_state.authenticated:
     with st.spinner('Authenticating with Strava...'):
         try:
             code = current_url['code'][0]  # Get the first value as query params are returned as lists
+            from utils.strava import exchange_code_for_token
             token_data = exchange_code_for_token(code)
             
             if token_data:
@@ -63,9 +74,10 @@ if offline_mode != st.session_state.offline_mode:
     st.session_state.offline_mode = offline_mode
     st.rerun()
 
-# User selector in offline mode
+# User selector in offline mode: the users with a local snapshot
 if st.session_state.offline_mode:
-    user_ids = get_all_user_ids()
+    from utils.snapshot import snapshot_user_ids
+    user_ids = snapshot_user_ids()
     if user_ids:
         selected_user = st.sidebar.selectbox(
             "Select User", 
@@ -76,9 +88,9 @@ if st.session_state.offline_mode:
             st.session_state.user_id = selected_user
             st.rerun()
     else:
-        st.sidebar.warning("No users found in database")
+        st.sidebar.warning("No local snapshots found; sync online first")
 
-page = st.sidebar.radio("Navigation", ["Home", "Get Data", "Visualizations"])
+page = st.sidebar.radio("Navigation", list(PAGES))
 
 # Display user authentication status
 if st.session_state.offline_mode:
@@ -88,141 +100,33 @@ elif st.session_state.authenticated:
 else:
     st.sidebar.warning("❌ Not connected to Strava")
 
-# Home page
-if page == "Home":
-    st.title("Strava Activity Dashboard")
-    st.write("This app allows you to retrieve your Strava activities and visualize them.")
-    
-    if st.session_state.offline_mode:
-        st.info("You are in offline mode. You can view your previously saved data.")
-        st.write("Use the sidebar to navigate to Visualizations.")
-    elif not st.session_state.authenticated:
-        st.write("To get started, connect your Strava account:")
-        
-        # Generate a redirect URL to this app
-        redirect_uri = st.secrets.get("REDIRECT_URI", "http://localhost:8501")
-        # For Streamlit Cloud, make sure we're using https
-        if redirect_uri.startswith("stravagetdatav2.streamlit.app"):
-            redirect_uri = "https://" + redirect_uri
-        
-        st.write(f"Redirect URI: {redirect_uri}")  # Debug info - can remove later
-        auth_url = get_auth_url(redirect_uri)
-        
-        st.markdown(f"<a href='{auth_url}' target='_self'><button style='background-color:#FC4C02; color:white; padding:10px; border-radius:5px; border:none;'>Connect with Strava</button></a>", unsafe_allow_html=True)
-        st.markdown("**Note:** If you encounter any issues with the redirect, please sign in directly to Strava first in another tab, then return here and click the connect button.", unsafe_allow_html=True)
-    else:
-        st.write("You are connected to Strava! Use the sidebar to navigate.")
-        
-        # Show a button to disconnect if needed
-        if st.button("Disconnect from Strava"):
-            st.session_state.user_id = None
-            st.session_state.authenticated = False
-            st.session_state.activities_loaded = False
-            st.rerun()
-
-# Get Data page
-elif page == "Get Data":
-    st.title("Get Data from Strava")
-    
-    if st.session_state.offline_mode:
-        st.info("You are in offline mode. Switch to online mode to fetch new data from Strava.")
-        
-        # Check if any activities are in the database for the selected user
-        if st.session_state.user_id:
-            activities = get_user_activities(st.session_state.user_id)
-            if activities and len(activities) > 0:
-                st.success(f"{len(activities)} activities found in the database for the selected user.")
-            else:
-                st.warning("No activities found in the database for the selected user.")
-    elif not st.session_state.authenticated:
-        st.warning("You need to connect your Strava account first. Go to the Home page.")
-    else:
-        st.write("Fetch your activities from Strava and save them to the database.")
-        
-        col1, col2 = st.columns(2)
-        with col1:
-            # Option to set how many pages of activities to fetch
-            max_pages = st.number_input("Number of pages to fetch (50 activities per page)", 
-                                        min_value=1, max_value=10, value=2)
-        
-        with col2:
-            # Fetch activities button
-            if st.button("Fetch Activities"):
-                activities_count = 0
-                progress_bar = st.progress(0)
-                status_text = st.empty()
-                
-                for page in range(1, max_pages + 1):
-                    status_text.text(f"Fetching page {page} of {max_pages}...")
-                    activities = get_activities(st.session_state.user_id, page=page)
-                    
-                    if activities and len(activities) > 0:
-                        count = save_activities(st.session_state.user_id, activities)
-                        activities_count += count
-                    else:
-                        break
-                    
-                    progress_bar.progress(page / max_pages)
-                
-                progress_bar.progress(1.0)
-                status_text.text(f"Completed: Saved {activities_count} activities to the database.")
-                st.session_state.activities_loaded = True
+# Display database status (read from the shared client's health state)
+db_status = get_connection_status()
+if get_storage_backend() == "sqlite":
+    st.sidebar.info("💾 Using local SQLite storage")
+elif db_status["healthy"]:
+    st.sidebar.success("✅ Connected to MongoDB")
+elif db_status["healthy"] is False:
+    st.sidebar.error(f"❌ MongoDB unavailable, retrying in {db_status['retry_in']}s")
 
-        # Check if any activities are in the database
-        activities = get_user_activities(st.session_state.user_id)
-        if activities and len(activities) > 0:
-            st.success(f"{len(activities)} activities found in the database.")
-        else:
-            st.info("No activities found in the database. Click 'Fetch Activities' to get your data.")
+try:
+    perf.timed_import(PAGES[page]).render()
+except DatabaseUnavailable:
+    st.error("MongoDB is unavailable, so nothing can be read or saved right now. Please try again shortly.")
 
-# Visualizations page
-elif page == "Visualizations":
-    st.title("Activity Visualizations")
-    
-    if not st.session_state.offline_mode and not st.session_state.authenticated:
-        st.warning("You need to connect your Strava account first or enable offline mode to view visualizations.")
-    elif not st.session_state.user_id:
-        st.warning("No user selected. Please select a user in offline mode or connect to Strava.")
-    else:
-        activities = get_user_activities(st.session_state.user_id)
-        
-        if not activities or len(activities) == 0:
-            st.warning("No activities found. Go to the 'Get Data' page to fetch your activities.")
-        else:
-            # Prepare data for visualization
-            df = prepare_activity_data(activities)
-            
-            # Display summary statistics
-            st.subheader("Summary Statistics")
-            col1, col2, col3, col4 = st.columns(4)
-            
-            with col1:
-                st.metric("Total Activities", len(df))
-            
-            with col2:
-                if 'distance_km' in df.columns:
-                    total_distance = round(df['distance_km'].sum(), 2)
-                    st.metric("Total Distance (km)", total_distance)
-            
-            with col3:
-                if 'moving_time_min' in df.columns:
-                    total_time = round(df['moving_time_min'].sum() / 60, 2)
-                    st.metric("Total Time (hours)", total_time)
-            
-            with col4:
-                if 'velocity_kmh' in df.columns:
-                    avg_velocity = round(df['velocity_kmh'].mean(), 2)
-                    st.metric("Avg Velocity (km/h)", avg_velocity)
-            
-            # Select visualization tab
-            st.subheader("Visualizations")
-            tab1, tab2 = st.tabs(["Weekly Volume", "Weekly Velocity"])
-            
-            with tab1:
-                st.plotly_chart(create_weekly_volume_chart(df), use_container_width=True)
-            
-            with tab2:
-                st.plotly_chart(create_weekly_velocity_chart(df), use_container_width=True)
+# Performance panel: spans of this run and histograms across recent runs
+st.sidebar.checkbox("Performance panel", key="show_perf")
+request_spans = perf.end_request()
+if st.session_state.show_perf and request_spans is not None:
+    import pandas as pd
+    with st.sidebar.expander("Performance", expanded=True):
+        st.caption("This run")
+        st.dataframe(pd.DataFrame.from_dict(request_spans, orient="index").round(2), use_container_width=True)
+        st.caption("Recent runs (ms)")
+        histograms = pd.DataFrame.from_dict(perf.histograms(), orient="index")
+        st.dataframe(histograms[["count", "p50_ms", "p95_ms", "max_ms"]].round(2), use_container_width=True)
+        st.caption("Page module imports (ms)")
+        st.dataframe(pd.Series(perf.import_times(), name="ms").round(2), use_container_width=True)
 
 if __name__ == "__main__":
     # Run the app
@@ -0,0 +1,132 @@
+"""
+Cold-start benchmark: how long a fresh Python process takes to import what
+app.py needs before it can draw each page, and which modules dominate.
+
+    python -m benchmarks.coldstart --output coldstart.json
+    python -m benchmarks.coldstart --compare coldstart.json --max-ratio 1.2
+
+Every run is a new interpreter, so nothing is cached in sys.modules.
+Streamlit is imported before the clock starts: it is the same for every
+page and would otherwise hide the differences. One extra run under
+python -X importtime lists the slowest modules. With --max-ratio the
+command exits with status 1 when a page got slower than the baseline by
+more than that factor.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# Modules app.py imports at the top of every script run (besides streamlit)
+APP_IMPORTS = ["utils.config", "utils.db", "utils.perf"]
+
+# What each page loads on a cold start. "all_pages" is everything app.py
+# used to import up front, before pages were loaded lazily.
+TARGETS = {
+    "home": APP_IMPORTS + ["views.home"],
+    "get_data": APP_IMPORTS + ["views.get_data"],
+    "visualizations": APP_IMPORTS + ["views.visualizations"],
+    "cohort": APP_IMPORTS + ["views.cohort"],
+    "all_pages": APP_IMPORTS + ["views.home", "views.get_data", "views.visualizations", "views.cohort"],
+}
+
+def import_seconds(modules):
+    """
+    Seconds a fresh interpreter takes to import modules after streamlit
+    """
+    code = "import streamlit, time; start = time.perf_counter(); {}; print(time.perf_counter() - start)".format(
+        "; ".join(f"import {module}" for module in modules)
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+def import_profile(modules):
+    """
+    Cumulative import time (µs) per module from python -X importtime,
+    leaving out what streamlit itself imports
+    """
+    code = "import streamlit; " + "; ".join(f"import {module}" for module in modules)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, check=True)
+    cumulative = {}
+    seen_streamlit = False
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].strip()
+        if not seen_streamlit:
+            # Modules are reported when their import finishes; streamlit's come first
+            seen_streamlit = name == "streamlit"
+            continue
+        cumulative[name] = int(parts[1])
+    return cumulative
+
+def measure(name, modules, repeat, top):
+    times = [import_seconds(modules) for _ in range(repeat)]
+    # Project modules and top-level third-party packages that took the longest
+    cumulative = import_profile(modules)
+    packages = {
+        module: us for module, us in cumulative.items()
+        if "." not in module or module.startswith(("utils.", "views."))
+    }
+    slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "name": name,
+        "repeat": repeat,
+        "median_ms": statistics.median(times) * 1000,
+        "min_ms": min(times) * 1000,
+        "slowest": [{"module": module, "ms": us / 1000} for module, us in slowest],
+    }
+
+def compare(results, baseline_path, max_ratio=None):
+    """
+    Print each page's median import time against a baseline; returns False
+    if any page regressed by more than max_ratio
+    """
+    with open(baseline_path) as f:
+        baseline = {r["name"]: r for r in json.load(f)["results"]}
+    ok = True
+    print(f"{'page':<20}{'base (ms)':>12}{'new (ms)':>12}{'ratio':>8}")
+    for result in results:
+        base = baseline.get(result["name"])
+        if not base:
+            continue
+        ratio = result["median_ms"] / base["median_ms"] if base["median_ms"] else float("nan")
+        flag = ""
+        if max_ratio and ratio > max_ratio:
+            flag = "  REGRESSION"
+            ok = False
+        print(f"{result['name']:<20}{base['median_ms']:>12.1f}{result['median_ms']:>12.1f}{ratio:>8.2f}{flag}")
+    return ok
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark cold-start import time per dashboard page.")
+    parser.add_argument("--pages", nargs="*", choices=list(TARGETS), help="pages to measure (default: all)")
+    parser.add_argument("--repeat", type=int, default=7, help="fresh interpreters per page")
+    parser.add_argument("--top", type=int, default=8, help="slowest modules listed per page")
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--compare", help="baseline JSON results to compare against")
+    parser.add_argument("--max-ratio", type=float, help="fail when a page is this much slower than the baseline")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = []
+    for name in args.pages or TARGETS:
+        result = measure(name, TARGETS[name], args.repeat, args.top)
+        results.append(result)
+        slowest = ", ".join(f"{entry['module']} {entry['ms']:.0f}" for entry in result["slowest"][:4])
+        print(f"{name:<20}{result['median_ms']:>10.1f} ms   ({slowest})")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"meta": {"python": sys.version.split()[0], "args": vars(args)}, "results": results}, f, indent=2)
+    if args.compare and not compare(results, args.compare, args.max_ratio):
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
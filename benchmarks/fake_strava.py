@@ -0,0 +1,145 @@
+"""
+Local stand-in for the Strava token, athlete activities and activity streams
+endpoints, with configurable latency and rate-limit headers
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from benchmarks.synthetic import activities_by_user, generate_streams
+
+class FakeStrava:
+    """
+    Serve synthetic activities over HTTP on localhost.
+
+    latency is added to every request (seconds). short_limit/daily_limit are
+    reported in X-RateLimit-* headers; requests beyond them get a 429.
+    """
+    def __init__(self, activities, latency=0.0, short_limit=10000, daily_limit=100000):
+        self.users = activities_by_user(activities)
+        self.activities = {activity["id"]: activity for activity in activities}
+        self.latency = latency
+        self.short_limit = short_limit
+        self.daily_limit = daily_limit
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def token_url(self):
+        return self.base_url + "/oauth/token"
+
+    @property
+    def activities_url(self):
+        return self.base_url + "/api/v3/athlete/activities"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _count_request(self):
+        with self.lock:
+            self.requests += 1
+            return self.requests
+
+    def _page(self, user_id, query):
+        activities = self.users.get(user_id, [])
+        after = query.get("after")
+        if after:
+            after = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(int(after[0])))
+            # With after=, Strava returns the newer activities oldest first
+            activities = [a for a in reversed(activities) if a["start_date"] > after]
+        page = int(query.get("page", ["1"])[0])
+        per_page = int(query.get("per_page", ["30"])[0])
+        return activities[(page - 1) * per_page:page * per_page]
+
+    def _streams(self, activity_id, query):
+        activity = self.activities.get(activity_id)
+        if activity is None:
+            return None
+        keys = query.get("keys", [""])[0].split(",")
+        streams = generate_streams(activity)
+        return {
+            key: {"data": data, "series_type": "time", "original_size": len(data), "resolution": "high"}
+            for key, data in streams.items() if key in keys
+        }
+
+    @property
+    def streams_url(self):
+        return self.base_url + "/api/v3/activities/{activity_id}/streams"
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body, usage):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.send_header("X-RateLimit-Limit", f"{fake.short_limit},{fake.daily_limit}")
+                self.send_header("X-RateLimit-Usage", f"{min(usage, fake.short_limit)},{usage}")
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _limited(self):
+                time.sleep(fake.latency)
+                usage = fake._count_request()
+                if usage > fake.short_limit:
+                    self._send(429, {"message": "Rate Limit Exceeded"}, usage)
+                    return None
+                return usage
+
+            def do_POST(self):
+                usage = self._limited()
+                if usage is None:
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                form = parse_qs(self.rfile.read(length).decode())
+                # Refresh tokens look like "refresh-<user_id>"
+                user_id = int(form.get("refresh_token", ["refresh-0"])[0].split("-")[-1])
+                self._send(200, {
+                    "access_token": f"access-{user_id}",
+                    "refresh_token": f"refresh-{user_id}",
+                    "expires_at": int(time.time()) + 6 * 3600,
+                    "athlete": {"id": user_id},
+                }, usage)
+
+            def do_GET(self):
+                usage = self._limited()
+                if usage is None:
+                    return
+                url = urlparse(self.path)
+                if url.path.endswith("/streams"):
+                    streams = fake._streams(int(url.path.split("/")[-2]), parse_qs(url.query))
+                    if streams is None:
+                        self._send(404, {"message": "Record Not Found"}, usage)
+                    else:
+                        self._send(200, streams, usage)
+                    return
+                # Access tokens look like "access-<user_id>"
+                user_id = int(self.headers.get("Authorization", "Bearer access-0").split("-")[-1])
+                self._send(200, fake._page(user_id, parse_qs(url.query)), usage)
+
+        return Handler
@@ -0,0 +1,389 @@
+"""
+Minimal in-memory stand-in for the subset of pymongo used by utils/db.py.
+
+Equality lookups on indexed fields use hash indexes, so costs scale like a
+real server rather than like a linear scan, and every command can be
+charged a simulated network round-trip so batching changes are visible.
+Aggregation supports $match, $group (with $sum, $avg, $min and $max),
+$project, $sort and $limit, with the few expression operators the rollup
+pipelines use ($cond, $ifNull, arithmetic, substrings and ISO weeks).
+"""
+import copy
+import datetime
+import itertools
+import threading
+import time
+from types import SimpleNamespace
+
+_COMPARISONS = {
+    "$gt": lambda a, b: a is not None and a > b,
+    "$gte": lambda a, b: a is not None and a >= b,
+    "$lt": lambda a, b: a is not None and a < b,
+    "$lte": lambda a, b: a is not None and a <= b,
+    "$ne": lambda a, b: a != b,
+    "$in": lambda a, b: a in b,
+    "$nin": lambda a, b: a not in b,
+}
+
+def _matches(document, query):
+    for field, condition in query.items():
+        value = document.get(field)
+        if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+            if not all(_COMPARISONS[op](value, operand) for op, operand in condition.items()):
+                return False
+        elif value != condition:
+            return False
+    return True
+
+def _project(document, projection):
+    if not projection:
+        return copy.deepcopy(document)
+    included = {field for field, flag in projection.items() if flag and field != "_id"}
+    if included:
+        result = {field: copy.deepcopy(document[field]) for field in included if field in document}
+        if projection.get("_id", 1):
+            result["_id"] = document["_id"]
+        return result
+    excluded = {field for field, flag in projection.items() if not flag}
+    return {k: copy.deepcopy(v) for k, v in document.items() if k not in excluded}
+
+def _field(document, path):
+    for key in path.split("."):
+        if not isinstance(document, dict):
+            return None
+        document = document.get(key)
+    return document
+
+def _date_from_string(arguments):
+    return datetime.datetime.fromisoformat(arguments["dateString"].replace("Z", "+00:00"))
+
+_OPERATORS = {
+    "$ifNull": lambda value, default: default if value is None else value,
+    "$gt": _COMPARISONS["$gt"],
+    "$multiply": lambda a, b: a * b,
+    "$divide": lambda a, b: a / b,
+    "$concat": lambda *parts: "".join(parts),
+    "$substrBytes": lambda string, start, length: string[start:start + length],
+    "$dateFromString": _date_from_string,
+    "$isoWeekYear": lambda date: date.isocalendar()[0],
+    "$isoWeek": lambda date: date.isocalendar()[1],
+}
+
+def _evaluate(document, expression):
+    """
+    Value of an aggregation expression: a "$field.path", an operator
+    expression, an object of expressions or a literal
+    """
+    if isinstance(expression, str) and expression.startswith("$"):
+        return _field(document, expression[1:])
+    if isinstance(expression, dict):
+        if any(key.startswith("$") for key in expression):
+            (op, arguments), = expression.items()
+            if op == "$cond":
+                # Only the taken branch is evaluated, as on the server
+                condition, then, otherwise = arguments
+                return _evaluate(document, then if _evaluate(document, condition) else otherwise)
+            if op not in _OPERATORS:
+                raise NotImplementedError(op)
+            if isinstance(arguments, list):
+                return _OPERATORS[op](*[_evaluate(document, argument) for argument in arguments])
+            return _OPERATORS[op](_evaluate(document, arguments))
+        return {key: _evaluate(document, value) for key, value in expression.items()}
+    return expression
+
+def _numbers(values):
+    return [value for value in values if isinstance(value, (int, float)) and not isinstance(value, bool)]
+
+_ACCUMULATORS = {
+    "$sum": lambda values: sum(_numbers(values)),
+    "$avg": lambda values: sum(_numbers(values)) / len(_numbers(values)) if _numbers(values) else None,
+    "$min": lambda values: min((value for value in values if value is not None), default=None),
+    "$max": lambda values: max((value for value in values if value is not None), default=None),
+}
+
+def _group(documents, spec):
+    groups = {}
+    for document in documents:
+        key = _evaluate(document, spec["_id"])
+        hashable = tuple(sorted(key.items())) if isinstance(key, dict) else key
+        groups.setdefault(hashable, (key, []))[1].append(document)
+    results = []
+    for key, members in groups.values():
+        result = {"_id": key}
+        for field, accumulator in spec.items():
+            if field == "_id":
+                continue
+            (op, expression), = accumulator.items()
+            result[field] = _ACCUMULATORS[op]([_evaluate(member, expression) for member in members])
+        results.append(result)
+    return results
+
+def _project_stage(document, spec):
+    if all(not flag for field, flag in spec.items()):
+        return {key: value for key, value in document.items() if key not in spec}
+    result = {"_id": document["_id"]} if spec.get("_id", 1) and "_id" in document else {}
+    for field, flag in spec.items():
+        if field == "_id":
+            continue
+        if flag is True or flag == 1:
+            if field in document:
+                result[field] = document[field]
+        elif flag:
+            result[field] = _evaluate(document, flag)
+    return result
+
+class MemoryCursor:
+    """
+    Already-fetched results supporting iteration and sort()
+    """
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, key, direction=1):
+        keys = key if isinstance(key, list) else [(key, direction)]
+        for field, field_direction in reversed(keys):
+            self.documents.sort(key=lambda d: d.get(field), reverse=field_direction < 0)
+        return self
+
+    def limit(self, n):
+        if n:
+            self.documents = self.documents[:n]
+        return self
+
+    def __iter__(self):
+        return iter(self.documents)
+
+class MemoryCollection:
+    def __init__(self, client):
+        self.client = client
+        self.documents = {}
+        self.indexes = {}
+        self.lock = threading.RLock()
+
+    # -- indexes -------------------------------------------------------------
+
+    def create_indexes(self, indexes):
+        self.client.round_trip()
+        with self.lock:
+            for index in indexes:
+                field = next(iter(index.document["key"]))
+                if field not in self.indexes:
+                    self.indexes[field] = {}
+                    for _id, document in self.documents.items():
+                        self._index_add(field, document.get(field), _id)
+        return [index.document["name"] for index in indexes]
+
+    def _index_add(self, field, value, _id):
+        self.indexes[field].setdefault(value, set()).add(_id)
+
+    def _index_remove(self, field, value, _id):
+        ids = self.indexes[field].get(value)
+        if ids:
+            ids.discard(_id)
+
+    def _candidates(self, query):
+        for field, condition in query.items():
+            if field not in self.indexes:
+                continue
+            if not isinstance(condition, dict):
+                return [self.documents[_id] for _id in self.indexes[field].get(condition, ())]
+            if list(condition) == ["$in"]:
+                ids = set()
+                for value in condition["$in"]:
+                    ids.update(self.indexes[field].get(value, ()))
+                return [self.documents[_id] for _id in ids]
+        return list(self.documents.values())
+
+    # -- reads ---------------------------------------------------------------
+
+    def _find(self, query):
+        return [d for d in self._candidates(query or {}) if _matches(d, query or {})]
+
+    def find(self, query=None, projection=None):
+        self.client.round_trip()
+        with self.lock:
+            return MemoryCursor([_project(d, projection) for d in self._find(query)])
+
+    def find_one(self, query=None, projection=None, sort=None):
+        self.client.round_trip()
+        with self.lock:
+            found = self._find(query)
+            if sort:
+                found = MemoryCursor(found).sort(sort).documents
+            return _project(found[0], projection) if found else None
+
+    def distinct(self, field, query=None):
+        self.client.round_trip()
+        with self.lock:
+            return list({d.get(field) for d in self._find(query)})
+
+    def count_documents(self, query):
+        self.client.round_trip()
+        with self.lock:
+            return len(self._find(query))
+
+    def aggregate(self, pipeline):
+        self.client.round_trip()
+        with self.lock:
+            if pipeline and "$match" in pipeline[0]:
+                # A leading $match can use the indexes
+                documents = self._find(pipeline[0]["$match"])
+                pipeline = pipeline[1:]
+            else:
+                documents = list(self.documents.values())
+            documents = [copy.deepcopy(d) for d in documents]
+        for stage in pipeline:
+            (name, spec), = stage.items()
+            if name == "$match":
+                documents = [d for d in documents if _matches(d, spec)]
+            elif name == "$group":
+                documents = _group(documents, spec)
+            elif name == "$project":
+                documents = [_project_stage(d, spec) for d in documents]
+            elif name == "$sort":
+                documents = MemoryCursor(documents).sort(list(spec.items())).documents
+            elif name == "$limit":
+                documents = documents[:spec]
+            else:
+                raise NotImplementedError(name)
+        return MemoryCursor(documents)
+
+    # -- writes --------------------------------------------------------------
+
+    def _apply(self, document, update):
+        for op, fields in update.items():
+            for field, value in fields.items():
+                if op == "$set":
+                    document[field] = copy.deepcopy(value)
+                elif op == "$unset":
+                    document.pop(field, None)
+                elif op == "$inc":
+                    document[field] = document.get(field, 0) + value
+                elif op == "$max":
+                    if field not in document or value > document[field]:
+                        document[field] = value
+                elif op == "$min":
+                    if field not in document or value < document[field]:
+                        document[field] = value
+                elif op == "$setOnInsert":
+                    pass
+                else:
+                    raise NotImplementedError(op)
+
+    def _update(self, query, update, upsert):
+        """
+        Returns (matched, modified, upserted)
+        """
+        found = self._find(query)
+        if found:
+            document = found[0]
+            before = copy.deepcopy(document)
+            self._unindex(document)
+            self._apply(document, update)
+            self._reindex(document)
+            return 1, int(before != document), 0
+        if not upsert:
+            return 0, 0, 0
+        document = {k: v for k, v in query.items() if not isinstance(v, dict)}
+        document["_id"] = next(self.client.ids)
+        self._apply(document, update)
+        self._apply(document, {"$set": update.get("$setOnInsert", {})})
+        self.documents[document["_id"]] = document
+        self._reindex(document)
+        return 0, 0, 1
+
+    def _unindex(self, document):
+        for field in self.indexes:
+            self._index_remove(field, document.get(field), document["_id"])
+
+    def _reindex(self, document):
+        for field in self.indexes:
+            self._index_add(field, document.get(field), document["_id"])
+
+    def update_one(self, query, update, upsert=False):
+        self.client.round_trip()
+        with self.lock:
+            matched, modified, upserted = self._update(query, update, upsert)
+        return SimpleNamespace(matched_count=matched, modified_count=modified, upserted_id=upserted or None)
+
+    def update_many(self, query, update, upsert=False):
+        self.client.round_trip()
+        with self.lock:
+            matched = modified = 0
+            for document in self._find(query):
+                before = copy.deepcopy(document)
+                self._unindex(document)
+                self._apply(document, update)
+                self._reindex(document)
+                matched += 1
+                modified += int(before != document)
+        return SimpleNamespace(matched_count=matched, modified_count=modified)
+
+    def bulk_write(self, operations, ordered=True):
+        self.client.round_trip()
+        matched = modified = upserted = 0
+        with self.lock:
+            for operation in operations:
+                m, mod, up = self._update(operation._filter, operation._doc, operation._upsert)
+                matched += m
+                modified += mod
+                upserted += up
+        return SimpleNamespace(matched_count=matched, modified_count=modified, upserted_count=upserted)
+
+    def delete_many(self, query):
+        self.client.round_trip()
+        with self.lock:
+            found = self._find(query)
+            for document in found:
+                self._unindex(document)
+                del self.documents[document["_id"]]
+        return SimpleNamespace(deleted_count=len(found))
+
+class MemoryDatabase:
+    def __init__(self, client):
+        self.client = client
+        self.collections = {}
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = MemoryCollection(self.client)
+        return self.collections[name]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def command(self, name):
+        self.client.round_trip()
+        return {"ok": 1.0}
+
+class MemoryMongoClient:
+    """
+    In-memory client. latency is charged (slept) once per command.
+    """
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.commands = 0
+        self.ids = itertools.count(1)
+        self.databases = {}
+        self.lock = threading.Lock()
+
+    def round_trip(self):
+        with self.lock:
+            self.commands += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def __getitem__(self, name):
+        if name not in self.databases:
+            self.databases[name] = MemoryDatabase(self)
+        return self.databases[name]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def drop_database(self, name):
+        self.databases.pop(name, None)
@@ -0,0 +1,267 @@
+"""
+Reproducible benchmarks for the data pipeline.
+
+    python -m benchmarks.run --sizes 1000 10000 --output bench.json
+    python -m benchmarks.run --sizes 1000 10000 --compare bench.json
+
+MongoDB is replaced by an in-memory stand-in (benchmarks/memory_mongo.py)
+that charges a simulated round-trip per command, unless BENCH_MONGO_URI
+points at a real (disposable) server. --backend sqlite benchmarks the
+embedded SQLite store in a temporary file instead. Strava is replaced by a local HTTP
+stand-in (benchmarks/fake_strava.py) with configurable latency.
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+
+# Streamlit warns about every st.* call made outside `streamlit run`
+logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+from benchmarks.fake_strava import FakeStrava
+from benchmarks.memory_mongo import MemoryMongoClient
+from benchmarks.synthetic import generate_activities
+from utils import db, snapshot, strava
+from utils.cohort import cohort_weekly, weekly_leaderboard
+from utils.ratelimit import RateLimitScheduler
+from utils.sync import PER_PAGE, sync_activities
+from utils.rollups import frame_arrays, rollup, rollup_frame
+from utils.sqlite_store import SQLiteStore
+from utils.visualization import ACTIVITY_FIELDS, create_velocity_chart, create_volume_chart, prepare_activity_data
+
+BENCH_USER = 1000
+
+def use_mongo_standin(latency):
+    """
+    Point utils.db at a disposable database: BENCH_MONGO_URI if set,
+    otherwise the in-memory stand-in with the given round-trip latency
+    """
+    db._backend = "mongo"
+    uri = os.getenv("BENCH_MONGO_URI")
+    if uri:
+        from pymongo import MongoClient
+        db._client = MongoClient(uri)
+    else:
+        db._client = MemoryMongoClient(latency=latency)
+    reset_database()
+
+def use_sqlite():
+    """
+    Point utils.db at an SQLite store in a fresh temporary file
+    """
+    db._backend = "sqlite"
+    db._sqlite_store = SQLiteStore(os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+def reset_database():
+    if db.get_storage_backend() == "sqlite":
+        with db.get_sqlite_store().connection() as conn:
+            conn.execute("DELETE FROM activities")
+            conn.execute("DELETE FROM users")
+        return
+    db.get_client().drop_database("strava_data")
+    db._indexes_ready = False
+
+def _mongo_commands():
+    if db.get_storage_backend() == "sqlite":
+        return None
+    return getattr(db.get_client(), "commands", None)
+
+def measure(fn, repeat, setup=None):
+    """
+    Run fn `repeat` times. Returns the wall-clock seconds of each run and,
+    with the in-memory stand-in, the MongoDB commands issued per run.
+    """
+    times = []
+    commands = 0
+    for _ in range(repeat):
+        if setup:
+            setup()
+        before = _mongo_commands()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+        if before is not None:
+            commands += _mongo_commands() - before
+    return times, (commands // repeat if _mongo_commands() is not None else None)
+
+def bench_frames(activities, repeat):
+    """
+    prepare_activity_data, the weekly volume and velocity charts and a
+    daily volume chart over the whole history (downsampled to the point
+    budget), each rolled up from the prepared frame
+    """
+    df = prepare_activity_data(activities)
+
+    def rollup_of(resolution):
+        return rollup_frame(rollup(*frame_arrays(df), resolution), resolution)
+
+    return {
+        "prepare_activity_data": measure(lambda: prepare_activity_data(activities), repeat),
+        "weekly_volume_chart": measure(lambda: create_volume_chart(rollup_of("week"), "week"), repeat),
+        "weekly_velocity_chart": measure(lambda: create_velocity_chart(rollup_of("week"), "week"), repeat),
+        "daily_volume_chart": measure(lambda: create_volume_chart(rollup_of("day"), "day").to_json(), repeat),
+    }
+
+def bench_storage(activities, repeat):
+    """
+    save_activities into an empty database, then get_user_activities
+    """
+    results = {
+        "save_activities": measure(
+            lambda: db.save_activities(BENCH_USER, activities), repeat, setup=reset_database
+        ),
+    }
+    results["get_user_activities"] = measure(lambda: db.get_user_activities(BENCH_USER), repeat)
+    results["get_user_activities_projected"] = measure(
+        lambda: db.get_user_activities(BENCH_USER, fields=ACTIVITY_FIELDS), repeat
+    )
+    return results
+
+def bench_cohort(activities, repeat):
+    """
+    cohort_weekly and a weekly leaderboard over every athlete's activities,
+    read from the weekly rollups (or rolled up in pandas with SQLite)
+    """
+    reset_database()
+    by_user = {}
+    for activity in activities:
+        by_user.setdefault(activity["athlete"]["id"], []).append(activity)
+    for user_id, user_activities in by_user.items():
+        db.save_activities(user_id, user_activities)
+    user_ids = list(by_user)
+    db.ensure_rollups(user_ids)
+    week = max(activity["start_date"] for activity in activities)[:10]
+    return {
+        "cohort_weekly": measure(lambda: cohort_weekly(user_ids), repeat),
+        "weekly_leaderboard": measure(lambda: weekly_leaderboard(user_ids, week, limit=10), repeat),
+    }
+
+def bench_sync(activities, repeat, latency):
+    """
+    The full page-fetch loop (sync_activities) against the local Strava stand-in
+    """
+    pages = math.ceil(len(activities) / PER_PAGE) + 1
+    with FakeStrava(activities, latency=latency) as fake, tempfile.TemporaryDirectory() as snapshot_dir:
+        strava.TOKEN_URL = fake.token_url
+        strava.ACTIVITIES_URL = fake.activities_url
+        strava.scheduler = RateLimitScheduler(short_limit=fake.short_limit, daily_limit=fake.daily_limit,
+                                              burst=fake.short_limit)
+        snapshot.SNAPSHOT_DIR = snapshot_dir
+
+        def setup():
+            reset_database()
+            strava._token_cache.clear()
+            db.save_user(BENCH_USER, f"access-{BENCH_USER}", f"refresh-{BENCH_USER}", int(time.time()) + 3600)
+
+        return {
+            "sync_activities": measure(
+                lambda: sync_activities(BENCH_USER, full=True, max_pages=pages), repeat, setup=setup
+            ),
+        }
+
+def summarize(name, size, measured):
+    times, commands = measured
+    return {
+        "name": name,
+        "size": size,
+        "repeat": len(times),
+        "mongo_commands": commands,
+        "min_s": min(times),
+        "median_s": statistics.median(times),
+        "mean_s": statistics.mean(times),
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline_path):
+    """
+    Print the median time of each benchmark against a baseline results file
+    """
+    with open(baseline_path) as f:
+        baseline = {(r["name"], r["size"]): r for r in json.load(f)["results"]}
+    print(f"{'benchmark':<32}{'size':>10}{'base (ms)':>12}{'new (ms)':>12}{'ratio':>8}")
+    for result in results:
+        base = baseline.get((result["name"], result["size"]))
+        if not base:
+            continue
+        ratio = result["median_s"] / base["median_s"] if base["median_s"] else float("nan")
+        print(f"{result['name']:<32}{result['size']:>10}{base['median_s'] * 1000:>12.2f}"
+              f"{result['median_s'] * 1000:>12.2f}{ratio:>8.2f}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Strava dashboard data pipeline.")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000],
+                        help="activity counts to benchmark (1k to 1M)")
+    parser.add_argument("--users", type=int, default=1, help="athletes the activities are spread over")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark")
+    parser.add_argument("--latency", type=float, default=0.02, help="Strava stand-in latency (seconds)")
+    parser.add_argument("--mongo-latency", type=float, default=0.001,
+                        help="simulated MongoDB round-trip for the in-memory stand-in (seconds)")
+    parser.add_argument("--sync-max", type=int, default=5000,
+                        help="largest size for the page-fetch benchmark")
+    parser.add_argument("--backend", choices=["mongo", "sqlite"], default="mongo",
+                        help="storage backend to benchmark")
+    parser.add_argument("--only", nargs="*", choices=["frames", "storage", "cohort", "sync"],
+                        help="run only these benchmark groups")
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--compare", help="baseline JSON results to compare against")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    groups = set(args.only or ["frames", "storage", "cohort", "sync"])
+    if args.backend == "sqlite":
+        use_sqlite()
+    else:
+        use_mongo_standin(args.mongo_latency)
+
+    results = []
+    for size in args.sizes:
+        activities = generate_activities(size, n_users=args.users)
+        user_activities = [a for a in activities if a["athlete"]["id"] == BENCH_USER]
+        timings = {}
+        if "frames" in groups:
+            timings.update(bench_frames(user_activities, args.repeat))
+        if "storage" in groups:
+            timings.update(bench_storage(user_activities, args.repeat))
+        if "cohort" in groups:
+            timings.update(bench_cohort(activities, args.repeat))
+        if "sync" in groups and size <= args.sync_max:
+            timings.update(bench_sync(activities, args.repeat, args.latency))
+        for name, measured in timings.items():
+            result = summarize(name, size, measured)
+            results.append(result)
+            print(f"{name:<32}{size:>10}{result['median_s'] * 1000:>12.2f} ms")
+
+    output = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": args.backend,
+            "mongo": "uri" if os.getenv("BENCH_MONGO_URI") else "memory",
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+    return output
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Synthetic Strava activities for benchmarks
+"""
+import random
+import numpy as np
+from datetime import datetime, timedelta, timezone
+
+# sport_type -> (legacy type, mean distance in m, mean speed in m/s)
+SPORTS = {
+    "Run": ("Run", 9000, 3.0),
+    "TrailRun": ("Run", 14000, 2.4),
+    "Ride": ("Ride", 45000, 7.5),
+    "VirtualRide": ("VirtualRide", 35000, 8.5),
+    "Swim": ("Swim", 2200, 0.9),
+    "Walk": ("Walk", 5000, 1.4),
+    "Hike": ("Hike", 11000, 1.2),
+}
+
+def generate_activities(n, n_users=1, years=5, seed=0, start_id=1):
+    """
+    Generate n Strava-shaped summary activities spread over n_users athletes
+    and the last `years` years, including the nested map/athlete fields the
+    real API returns
+    """
+    rng = random.Random(seed)
+    sports = list(SPORTS)
+    end = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    span = int(years * 365 * 24 * 3600)
+
+    activities = []
+    for i in range(n):
+        sport = rng.choice(sports)
+        activity_type, mean_distance, mean_speed = SPORTS[sport]
+        distance = max(100.0, rng.gauss(mean_distance, mean_distance / 3))
+        moving_time = int(distance / max(0.2, rng.gauss(mean_speed, mean_speed / 8)))
+        start = end - timedelta(seconds=rng.randrange(span))
+        user_id = 1000 + i % n_users
+        activities.append({
+            "resource_state": 2,
+            "athlete": {"id": user_id, "resource_state": 1},
+            "name": f"{sport} {i}",
+            "distance": round(distance, 1),
+            "moving_time": moving_time,
+            "elapsed_time": moving_time + rng.randrange(0, 900),
+            "total_elevation_gain": round(rng.uniform(0, 800), 1),
+            "type": activity_type,
+            "sport_type": sport,
+            "id": start_id + i,
+            "start_date": start.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "start_date_local": start.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "timezone": "(GMT+00:00) Europe/London",
+            "average_speed": round(distance / max(moving_time, 1), 3),
+            "max_speed": round(distance / max(moving_time, 1) * 1.6, 3),
+            "has_heartrate": True,
+            "average_heartrate": round(rng.uniform(110, 170), 1),
+            "max_heartrate": round(rng.uniform(170, 195), 1),
+            "map": {
+                "id": f"a{start_id + i}",
+                "summary_polyline": "".join(rng.choice("abcdefghijklmnopqrstuvwxyz_~@?") for _ in range(200)),
+                "resource_state": 2,
+            },
+            "kudos_count": rng.randrange(0, 50),
+        })
+    return activities
+
+def activities_by_user(activities):
+    """
+    Group activities per athlete id, newest first (the API's default order)
+    """
+    users = {}
+    for activity in activities:
+        users.setdefault(activity["athlete"]["id"], []).append(activity)
+    for user_activities in users.values():
+        user_activities.sort(key=lambda a: a["start_date"], reverse=True)
+    return users
+
+def generate_streams(activity, seed=0):
+    """
+    Generate per-second streams (time, distance, heartrate, watts, cadence,
+    altitude) for a synthetic activity, as the streams endpoint returns them
+    """
+    rng = np.random.default_rng(seed + activity["id"])
+    n = max(1, int(activity["moving_time"]))
+    mean_speed = activity["distance"] / n
+    speed = np.clip(rng.normal(mean_speed, mean_speed / 6, n), 0, None)
+    # Slowly varying effort so mean-maximal curves have some shape
+    effort = np.convolve(rng.normal(0, 1, n), np.ones(60) / 60, mode="same")
+    return {
+        "time": np.arange(n).tolist(),
+        "distance": np.round(np.cumsum(speed), 1).tolist(),
+        "heartrate": np.clip(145 + 40 * effort + rng.normal(0, 3, n), 60, 200).astype(int).tolist(),
+        "watts": np.clip(200 + 300 * effort + rng.normal(0, 20, n), 0, None).astype(int).tolist(),
+        "cadence": np.clip(85 + rng.normal(0, 4, n), 0, None).astype(int).tolist(),
+        "altitude": np.round(100 + np.cumsum(rng.normal(0, 0.2, n)), 1).tolist(),
+    }
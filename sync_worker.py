@@ -0,0 +1,171 @@
+"""
+Headless sync worker: syncs every stored athlete's activities from Strava
+without the Streamlit UI.
+
+    python sync_worker.py                  # one incremental pass over all users
+    python sync_worker.py --workers 8      # sync up to 8 users at a time
+    python sync_worker.py --resume         # continue an interrupted pass
+    python sync_worker.py --interval 86400 # run as a daemon, one pass per day
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+# Loads .env once, before any other module reads its settings
+from utils import config
+from utils.db import DatabaseUnavailable, get_all_user_ids, get_database
+from utils.ratelimit import scheduler
+from utils.strava import get_rate_limit_status
+from utils.sync import STREAMS_PER_SYNC, sync_activities, sync_streams
+
+logger = logging.getLogger("sync_worker")
+
+# Default location of the checkpoint file used by --resume
+CHECKPOINT_PATH = os.getenv("SYNC_CHECKPOINT", os.path.join("data", "sync_checkpoint.json"))
+
+class Checkpoint:
+    """
+    Per-user progress of the current pass, saved to disk after every user
+    so an interrupted pass can be resumed
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.state = {"started_at": time.time(), "finished_at": None, "users": {}}
+
+    def load(self):
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.state = json.load(f)
+
+    def is_done(self, user_id):
+        return self.state["users"].get(str(user_id), {}).get("status") == "done"
+
+    def record(self, user_id, **fields):
+        with self.lock:
+            self.state["users"][str(user_id)] = dict(fields, updated_at=time.time())
+            self._save()
+
+    def finish(self):
+        with self.lock:
+            self.state["finished_at"] = time.time()
+            self._save()
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+def sync_user(user_id, args, checkpoint):
+    """
+    Sync one user, logging per-page progress and recording the outcome
+    """
+    def log_progress(pages_done, max_pages, fetched):
+        logger.info("user %s: %d/%d pages, %d activities", user_id, pages_done, max_pages, fetched)
+
+    checkpoint.record(user_id, status="running")
+    try:
+        result = sync_activities(user_id, full=args.full, max_pages=args.max_pages, on_page=log_progress)
+    except Exception as e:
+        logger.exception("user %s: sync failed", user_id)
+        checkpoint.record(user_id, status="failed", error=str(e))
+        return user_id, None
+
+    if args.streams:
+        try:
+            streams = sync_streams(user_id, limit=args.streams)
+        except Exception:
+            logger.exception("user %s: stream sync failed", user_id)
+            streams = {"saved": 0, "remaining": None, "complete": False}
+        logger.info("user %s: streams saved for %d activities", user_id, streams["saved"])
+        result["streams_remaining"] = streams["remaining"]
+    
+    status = "done" if result["complete"] else "incomplete"
+    checkpoint.record(user_id, status=status, **result)
+    logger.info(
+        "user %s: %s, %d fetched (%d new, %d modified)",
+        user_id, status, result["fetched"], result["inserted"], result["modified"]
+    )
+    return user_id, result
+
+def run_pass(args):
+    """
+    Sync every selected user once. Returns the number of users not fully synced.
+    """
+    checkpoint = Checkpoint(args.checkpoint)
+    if args.resume:
+        checkpoint.load()
+        if checkpoint.state.get("finished_at"):
+            # The previous pass completed; start a fresh one
+            checkpoint = Checkpoint(args.checkpoint)
+
+    user_ids = args.users or get_all_user_ids()
+    pending = [user_id for user_id in user_ids if not checkpoint.is_done(user_id)]
+    logger.info("syncing %d of %d users with %d workers", len(pending), len(user_ids), args.workers)
+
+    not_synced = 0
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(sync_user, user_id, args, checkpoint) for user_id in pending]
+        for future in as_completed(futures):
+            _, result = future.result()
+            if not result or not result["complete"]:
+                not_synced += 1
+
+    checkpoint.finish()
+    quota = get_rate_limit_status()
+    logger.info(
+        "pass finished: %d users not fully synced; Strava budget %d/%d (15 min), %d/%d (day)",
+        not_synced, quota["short_remaining"], quota["short_limit"],
+        quota["daily_remaining"], quota["daily_limit"]
+    )
+    return not_synced
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Sync Strava activities for all stored users.")
+    parser.add_argument("--users", nargs="*", type=int, help="only sync these user ids")
+    parser.add_argument("--workers", type=int, default=4, help="users synced at the same time")
+    parser.add_argument("--max-concurrency", type=int, default=None,
+                        help="cap on Strava requests in flight across all users")
+    parser.add_argument("--max-pages", type=int, default=10, help="maximum pages per user")
+    parser.add_argument("--streams", type=int, nargs="?", const=STREAMS_PER_SYNC, default=0,
+                        help="also fetch per-second streams for up to N activities per user")
+    parser.add_argument("--full", action="store_true", help="full resync instead of incremental")
+    parser.add_argument("--resume", action="store_true", help="skip users finished by an interrupted pass")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH, help="checkpoint file path")
+    parser.add_argument("--interval", type=float, default=None,
+                        help="run forever, starting a pass every INTERVAL seconds")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    if args.max_concurrency:
+        scheduler.set_max_concurrency(args.max_concurrency)
+
+    try:
+        get_database()
+    except DatabaseUnavailable:
+        logger.error("MongoDB is unreachable; nothing to sync")
+        return 1
+
+    if args.interval is None:
+        return 1 if run_pass(args) else 0
+
+    while True:
+        started = time.monotonic()
+        run_pass(args)
+        # Later passes always start fresh
+        args.resume = False
+        time.sleep(max(0.0, args.interval - (time.monotonic() - started)))
+
+if __name__ == "__main__":
+    sys.exit(main())
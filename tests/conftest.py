@@ -0,0 +1,31 @@
+import logging
+import pytest
+
+# Streamlit warns about every st.* call made outside `streamlit run`
+logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+from benchmarks.memory_mongo import MemoryMongoClient
+from utils import db, snapshot
+
+@pytest.fixture
+def memory_db(monkeypatch, tmp_path):
+    """
+    Point utils.db at a fresh in-memory MongoDB stand-in and keep
+    snapshots in a temporary directory
+    """
+    monkeypatch.setattr(db, "_backend", "mongo")
+    monkeypatch.setattr(db, "_client", MemoryMongoClient(latency=0))
+    monkeypatch.setattr(db, "_indexes_ready", False)
+    monkeypatch.setattr(db, "_data_versions", {})
+    monkeypatch.setattr(snapshot, "SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    return db.get_database()
+
+@pytest.fixture
+def sqlite_db(monkeypatch, tmp_path):
+    """
+    Point utils.db at a fresh SQLite store in a temporary directory
+    """
+    monkeypatch.setattr(db, "_backend", "sqlite")
+    monkeypatch.setattr(db, "_data_versions", {})
+    monkeypatch.setattr(db, "_sqlite_store", db.SQLiteStore(str(tmp_path / "strava.db")))
+    return db.get_sqlite_store()
@@ -0,0 +1,108 @@
+import time
+import pytest
+from utils import db
+
+def mongo_down(monkeypatch):
+    """
+    Select MongoDB with the health check backing off after a failed ping
+    """
+    monkeypatch.setattr(db, "_backend", "mongo")
+    monkeypatch.setattr(db, "_health", {
+        "healthy": False,
+        "failures": 1,
+        "last_check": time.monotonic(),
+        "retry_at": time.monotonic() + 60,
+        "last_error": "connection refused",
+    })
+
+def test_unreachable_mongo_backend_fails_fast_without_writing_elsewhere(monkeypatch):
+    mongo_down(monkeypatch)
+    monkeypatch.setattr(db, "_sqlite_store", None)
+    with pytest.raises(db.DatabaseUnavailable):
+        db.save_user(1, "access", "refresh", 0)
+    with pytest.raises(db.DatabaseUnavailable):
+        db.get_user(1)
+    assert db._sqlite_store is None
+
+def test_sqlite_backend_persists_streams_curves_and_training_load(sqlite_db):
+    from datetime import date
+    from utils import efforts, streams, training_load
+
+    activity = {"id": 7, "start_date": "2024-01-01T08:00:00Z", "sport_type": "Run",
+                "moving_time": 3600, "distance": 10000, "average_heartrate": 150}
+    db.save_activities(1, [activity])
+    assert streams.save_streams(1, 7, {"time": [0, 1, 2], "distance": [0.0, 3.0, 6.0]}) == 2
+    assert streams.stream_activity_ids(1) == {7}
+    assert list(streams.get_streams(7, ["distance"])["distance"]) == [0.0, 3.0, 6.0]
+
+    doc = efforts.save_activity_curves(1, activity, streams.get_streams(7))
+    assert efforts._cached_curves(1)[7]["curves"].keys() == doc["curves"].keys()
+
+    load = training_load.get_training_load(1, today=date(2024, 1, 3))
+    assert list(load.index.strftime("%Y-%m-%d")) == ["2024-01-01", "2024-01-02", "2024-01-03"]
+    # Stored state, not a session, seeds the next update
+    assert sqlite_db.last_training_load_day(1) == "2024-01-03"
+
+def test_offline_mode_reads_the_snapshot_while_mongo_is_down(monkeypatch, tmp_path):
+    from utils import cache, snapshot
+    monkeypatch.setattr(snapshot, "SNAPSHOT_DIR", str(tmp_path))
+    snapshot.write_snapshot(1, [{"id": 1, "start_date": "2024-01-01T08:00:00Z", "distance": 5000.0, "moving_time": 1500}])
+    mongo_down(monkeypatch)
+    assert snapshot.snapshot_user_ids() == [1]
+    resolution, rollup = cache.get_rollup_data(1, use_snapshot=True)
+    assert rollup["activity_count"].sum() == 1
+
+    # A new part changes the snapshot version, so the cached frame is rebuilt
+    snapshot.append_snapshot(1, [{"id": 2, "start_date": "2024-01-02T08:00:00Z", "distance": 5000.0, "moving_time": 1500}])
+    resolution, rollup = cache.get_rollup_data(1, use_snapshot=True)
+    assert rollup["activity_count"].sum() == 2
+
+def test_data_version_is_reread_after_the_ttl(monkeypatch, sqlite_db):
+    other_process = db.SQLiteStore(sqlite_db.path)
+    monkeypatch.setattr(db, "DATA_VERSION_TTL", 60)
+    assert db.get_data_version(1) == 0
+    other_process.bump_data_version(1)
+    # Reruns within the TTL skip the database
+    assert db.get_data_version(1) == 0
+    # Writes by this process are seen at once
+    db.bump_data_version(1)
+    assert db.get_data_version(1) == 2
+    other_process.bump_data_version(1)
+    monkeypatch.setattr(db, "DATA_VERSION_TTL", 0)
+    assert db.get_data_version(1) == 3
+
+def test_auto_backend_keeps_mongo_when_the_first_ping_fails(monkeypatch):
+    monkeypatch.setattr(db, "STORAGE_BACKEND", "auto")
+    monkeypatch.setattr(db, "_backend", None)
+    monkeypatch.setattr(db, "get_mongo_uri", lambda: "mongodb://unreachable")
+    monkeypatch.setattr(db, "_check_health", lambda: False)
+    assert db.get_storage_backend() == "mongo"
+
+    monkeypatch.setattr(db, "_backend", None)
+    monkeypatch.setattr(db, "get_mongo_uri", lambda: None)
+    assert db.get_storage_backend() == "sqlite"
+
+def test_rollups_are_grouped_on_the_server_like_rollup_documents(monkeypatch, memory_db):
+    from utils.rollups import ROLLUP_COLLECTIONS, period_range, rollup_documents
+    activities = [
+        {"id": 1, "start_date": "2020-12-31T23:30:00Z", "distance": 10000.0, "moving_time": 3000},
+        {"id": 2, "start_date": "2021-01-01T07:00:00Z", "distance": 5000.0, "moving_time": 0},
+        {"id": 3, "start_date": "2021-01-04T07:00:00Z", "distance": None, "moving_time": 1200},
+        {"id": 4, "start_date": "2021-01-04T18:00:00Z", "distance": 8000.0},
+        {"id": 5, "start_date": "2021-02-15T06:00:00Z", "distance": 12000.0, "moving_time": 3600},
+    ]
+    for activity in activities:
+        memory_db.activities.update_one({"id": activity["id"]}, {"$set": dict(activity, user_id=7)}, upsert=True)
+    # Only the per-period groups may leave the server
+    monkeypatch.setattr(type(memory_db.activities), "find", lambda *args, **kwargs: pytest.fail("activities fetched"))
+    
+    db.refresh_rollups(7, "2020-12-31", "2021-02-15")
+    
+    for resolution, collection in ROLLUP_COLLECTIONS.items():
+        start, end = period_range("2020-12-31", "2021-02-15", resolution)
+        stored = sorted(memory_db[collection].documents.values(), key=lambda doc: doc["period"])
+        stored = [{key: value for key, value in doc.items() if key != "_id"} for doc in stored]
+        expected = rollup_documents(7, activities, resolution, start, end)
+        assert len(stored) == len(expected)
+        for doc, expected_doc in zip(stored, expected):
+            assert doc == pytest.approx(expected_doc)
@@ -0,0 +1,69 @@
+import pytest
+from types import SimpleNamespace
+from utils import ratelimit
+from utils.ratelimit import SHORT_WINDOW, RateLimitExceeded, RateLimitScheduler
+
+class FakeClock:
+    """
+    Stands in for the time module; sleep() advances the clock instantly
+    """
+    def __init__(self, now):
+        self.now = now
+        self.slept = []
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        return self.responses.pop(0)
+
+def response(status_code, **headers):
+    return SimpleNamespace(status_code=status_code, headers=headers)
+
+@pytest.fixture
+def clock(monkeypatch):
+    # 100 s into a 15-minute window
+    clock = FakeClock(SHORT_WINDOW * 1_900_000 + 100.0)
+    monkeypatch.setattr(ratelimit, "time", clock)
+    return clock
+
+def test_429_is_retried_after_the_retry_after_delay(clock):
+    session = FakeSession([response(429, **{"Retry-After": "7"}), response(200)])
+    scheduler = RateLimitScheduler()
+    assert scheduler.request(session, "GET", "url").status_code == 200
+    assert session.calls == 2
+    assert clock.slept == [7.0]
+    assert scheduler.remaining()["retries"] == 1
+
+def test_429_waiting_longer_than_max_wait_is_returned(clock):
+    session = FakeSession([response(429, **{"Retry-After": "120"})])
+    assert RateLimitScheduler().request(session, "GET", "url", max_wait=60).status_code == 429
+    assert session.calls == 1 and clock.slept == []
+
+def test_exhausted_short_window_raises_when_the_reset_is_too_far(clock):
+    scheduler = RateLimitScheduler(short_limit=10, daily_limit=100)
+    scheduler.update_from_headers({"X-RateLimit-Limit": "10,100", "X-RateLimit-Usage": "10,10"})
+    with pytest.raises(RateLimitExceeded) as raised:
+        scheduler.acquire(max_wait=60)
+    assert raised.value.retry_in == pytest.approx(SHORT_WINDOW - 100)
+    assert clock.slept == []
+
+def test_exhausted_short_window_waits_for_the_reset(clock):
+    scheduler = RateLimitScheduler(short_limit=10, daily_limit=100)
+    scheduler.update_from_headers({"X-RateLimit-Limit": "10,100", "X-RateLimit-Usage": "10,10"})
+    scheduler.acquire(max_wait=SHORT_WINDOW)
+    assert sum(clock.slept) == pytest.approx(SHORT_WINDOW - 100)
+    assert scheduler.remaining()["short_remaining"] == 9
@@ -0,0 +1,144 @@
+import time
+import pytest
+from utils import db, strava, sync
+
+PER_PAGE = 2
+
+def activity(activity_id):
+    return {
+        "id": activity_id,
+        "start_date": f"2024-02-{activity_id:02d}T08:00:00Z",
+        "distance": 5000.0,
+        "moving_time": 1500,
+    }
+
+def fake_pages(monkeypatch, pages, delays):
+    """
+    Serve pages ({page: activities, or None for an API error}) after the
+    given per-page delays in seconds
+    """
+    def get_activities(user_id, page=1, per_page=50, after=None, access_token=None):
+        time.sleep(delays.get(page, 0))
+        return pages.get(page, [])
+
+    monkeypatch.setattr(strava, "get_valid_token", lambda user_id: "token")
+    monkeypatch.setattr(strava, "get_activities", get_activities)
+
+# Page 2 fails after pages 3 and 4 have already arrived
+FAILING_PAGE_2 = {
+    1: [activity(1), activity(2)],
+    2: None,
+    3: [activity(5), activity(6)],
+    4: [activity(7)],
+}
+SLOW_PAGE_2 = {1: 0.0, 2: 0.2, 3: 0.0, 4: 0.0}
+
+def test_pages_are_yielded_in_order_and_stop_at_a_failure(monkeypatch):
+    fake_pages(monkeypatch, FAILING_PAGE_2, SLOW_PAGE_2)
+    pages = list(strava.iter_activity_pages(1, max_pages=4, per_page=PER_PAGE, max_workers=4))
+    assert pages == [(1, FAILING_PAGE_2[1]), (2, None)]
+
+def test_pages_arriving_out_of_order_are_reordered(monkeypatch):
+    pages = {1: [activity(1), activity(2)], 2: [activity(3), activity(4)], 3: [activity(5)]}
+    fake_pages(monkeypatch, pages, {1: 0.2, 2: 0.1, 3: 0.0})
+    assert list(strava.iter_activity_pages(1, max_pages=5, per_page=PER_PAGE, max_workers=4)) == sorted(pages.items())
+
+def test_failed_page_is_not_complete(monkeypatch):
+    fake_pages(monkeypatch, FAILING_PAGE_2, SLOW_PAGE_2)
+    status = {}
+    ids = [a["id"] for a in strava.iter_activities(1, max_pages=4, per_page=PER_PAGE, status=status)]
+    assert ids == [1, 2]
+    assert status["failed"] and not status["complete"]
+
+def test_sync_never_moves_the_watermark_past_a_failed_page(monkeypatch, memory_db):
+    fake_pages(monkeypatch, FAILING_PAGE_2, SLOW_PAGE_2)
+    result = sync.sync_activities(1, max_pages=4, per_page=PER_PAGE)
+    assert sorted(a["id"] for a in db.get_user_activities(1)) == [1, 2]
+    assert db.get_sync_watermark(1) == activity(2)["start_date"]
+    assert not result["complete"]
+
+def test_incremental_sync_keeps_edited_activities_in_the_snapshot(monkeypatch, memory_db):
+    from utils.snapshot import read_snapshot
+    fake_pages(monkeypatch, {1: [activity(1), activity(2)], 2: [activity(3)]}, {})
+    sync.sync_activities(1, max_pages=4, per_page=PER_PAGE)
+
+    edited = dict(activity(2), distance=8000.0)
+    fake_pages(monkeypatch, {1: [edited, activity(4)]}, {})
+    sync.sync_activities(1, max_pages=1, per_page=PER_PAGE)
+
+    snapshot = read_snapshot(1).set_index("id")
+    assert sorted(snapshot.index) == [1, 2, 3, 4]
+    assert snapshot.loc[2, "distance"] == 8000.0
+
+def test_a_single_short_page_costs_one_call(monkeypatch):
+    calls = []
+    fake_pages(monkeypatch, {1: [activity(1)]}, {})
+    get_activities = strava.get_activities
+    monkeypatch.setattr(strava, "get_activities", lambda *args: calls.append(args[1]) or get_activities(*args))
+    pages = list(strava.iter_activity_pages(1, max_pages=10, per_page=PER_PAGE, after=0, max_workers=4))
+    assert pages == [(1, [activity(1)])]
+    assert calls == [1]
+
+def test_sync_with_no_budget_left_requests_nothing(monkeypatch, memory_db):
+    fake_pages(monkeypatch, {1: [activity(1)]}, {})
+    monkeypatch.setattr(sync, "get_rate_limit_status", lambda: {"daily_remaining": 0})
+    pages = []
+    result = sync.sync_activities(1, on_page=lambda *args: pages.append(args))
+    assert result["budget_exhausted"] and not result["failed"] and not result["complete"]
+    assert pages == [] and db.get_user_activities(1) == []
+
+def test_sync_result_tells_a_failure_from_the_page_limit(monkeypatch, memory_db):
+    fake_pages(monkeypatch, {1: [activity(1), activity(2)], 2: [activity(3), activity(4)]}, {})
+    result = sync.sync_activities(1, max_pages=1, per_page=PER_PAGE)
+    assert not result["failed"] and not result["complete"]
+    fake_pages(monkeypatch, FAILING_PAGE_2, SLOW_PAGE_2)
+    assert sync.sync_activities(1, max_pages=4, per_page=PER_PAGE)["failed"]
+
+def test_page_fetches_on_worker_threads_count_in_the_request_spans(monkeypatch):
+    from utils import perf
+    fake_pages(monkeypatch, {1: [activity(1), activity(2)], 2: [activity(3)]}, {})
+    get_activities = strava.get_activities
+
+    calls = []
+
+    def timed_get_activities(*args):
+        calls.append(args[1])
+        with perf.span("strava.http"):
+            return get_activities(*args)
+
+    monkeypatch.setattr(strava, "get_activities", timed_get_activities)
+    perf.begin_request(enabled=True)
+    list(strava.iter_activity_pages(1, max_pages=4, per_page=PER_PAGE, max_workers=4))
+    assert perf.end_request()["strava.http"]["count"] == len(calls) > 1
+
+def test_concurrent_callers_share_one_token_refresh(monkeypatch):
+    import threading
+    refreshes = []
+
+    def refresh_access_token(refresh_token):
+        refreshes.append(refresh_token)
+        time.sleep(0.05)
+        return {"access_token": "new", "refresh_token": "next", "expires_at": int(time.time()) + 3600}
+
+    monkeypatch.setattr(strava, "_token_cache", {})
+    monkeypatch.setattr(strava, "_refresh_locks", {})
+    monkeypatch.setattr(strava, "get_user", lambda user_id: {
+        "user_id": user_id, "access_token": "old", "refresh_token": "first", "expires_at": 0,
+    })
+    monkeypatch.setattr(strava, "save_user", lambda *args: None)
+    monkeypatch.setattr(strava, "refresh_access_token", refresh_access_token)
+
+    start = threading.Barrier(8)
+    tokens = []
+
+    def call():
+        start.wait()
+        tokens.append(strava.get_valid_token(1))
+
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert refreshes == ["first"]
+    assert tokens == ["new"] * 8
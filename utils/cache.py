@@ -0,0 +1,156 @@
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+import pandas as pd
+from utils.db import get_data_version, get_rollups, get_user_activities, rebuild_rollups, rollups_built
+from utils.efforts import all_time_curves
+from utils.rollups import choose_resolution, frame_arrays, rollup, rollup_frame
+from utils.snapshot import has_snapshot, read_snapshot, snapshot_version
+from utils.training_load import get_training_load
+from utils.visualization import ACTIVITY_FIELDS, prepare_activity_data, prepare_activity_frame
+
+# Maximum number of cached frames across all users
+CACHE_MAX_ENTRIES = int(os.getenv("FRAME_CACHE_SIZE", "32"))
+
+class UserDataCache:
+    """
+    LRU cache of per-user derived data (DataFrames). Entries are tagged with
+    the user's stored data version and recomputed once a save in any process
+    (the app or sync_worker.py) changes it.
+    Cached values are shared and must not be modified by callers.
+    """
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compute(self, user_id, key, compute, version=None):
+        """
+        Return the cached value for (user_id, key), calling compute() on a
+        miss. version defaults to the user's data version; values built
+        from the local snapshot pass its snapshot_version instead.
+        """
+        cache_key = (user_id, key)
+        # Read the version first so a write during compute() invalidates the result
+        if version is None:
+            version = get_data_version(user_id)
+        with self.lock:
+            entry = self.entries.get(cache_key)
+            if entry is not None and entry[0] == version:
+                self.entries.move_to_end(cache_key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        value = compute()
+
+        with self.lock:
+            self.entries[cache_key] = (version, value)
+            self.entries.move_to_end(cache_key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def invalidate(self, user_id=None):
+        """
+        Drop cached entries for one user, or for everyone
+        """
+        with self.lock:
+            for cache_key in list(self.entries):
+                if user_id is None or cache_key[0] == user_id:
+                    del self.entries[cache_key]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "users": len({cache_key[0] for cache_key in self.entries}),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+# Process-wide cache shared by all sessions
+frame_cache = UserDataCache()
+
+def get_prepared_activities(user_id, start_date=None, use_snapshot=False):
+    """
+    Return the user's prepared activity DataFrame, memoized until their data changes.
+    With use_snapshot, read the local columnar snapshot instead of the database
+    when one exists.
+    """
+    def compute():
+        if use_snapshot and has_snapshot(user_id):
+            return prepare_activity_frame(read_snapshot(user_id, ACTIVITY_FIELDS, start_date=start_date))
+        activities = get_user_activities(user_id, fields=ACTIVITY_FIELDS, start_date=start_date)
+        return prepare_activity_data(activities)
+
+    # Snapshot frames are keyed on the snapshot files, so offline mode needs no database
+    version = snapshot_version(user_id) if use_snapshot else None
+    return frame_cache.get_or_compute(user_id, ("activities", start_date, use_snapshot), compute, version)
+
+def get_curves(user_id, sport_types=None, start_date=None):
+    """
+    Return the user's all-time mean-maximal curves and best efforts,
+    memoized until new streams (or activities) are saved
+    """
+    sport_types = tuple(sorted(sport_types)) if sport_types else None
+    return frame_cache.get_or_compute(
+        user_id, ("curves", sport_types, start_date),
+        lambda: all_time_curves(user_id, sport_types=sport_types, start_date=start_date)
+    )
+
+def get_rollup_data(user_id, start_date=None, use_snapshot=False):
+    """
+    Return (resolution, rollup frame) for the charts: the finest of daily,
+    weekly or monthly totals that fits the chart point budget for the range
+    from start_date (or the first activity) to today. Reads the stored
+    rollups when MongoDB is available, otherwise rolls up the prepared
+    activities (or the local snapshot with use_snapshot).
+    """
+    today = datetime.utcnow().date()
+
+    def from_frame():
+        df = get_prepared_activities(user_id, start_date, use_snapshot=use_snapshot)
+        if df.empty:
+            return "week", pd.DataFrame()
+        days, distance, moving_time = frame_arrays(df)
+        resolution = choose_resolution(start_date or days.min(), today)
+        return resolution, rollup_frame(rollup(days, distance, moving_time, resolution), resolution, start_date)
+
+    def compute():
+        if use_snapshot and has_snapshot(user_id):
+            return from_frame()
+        monthly = get_rollups(user_id, "month", start_date)
+        if monthly is None:
+            return from_frame()
+        if not rollups_built(user_id):
+            # Activities saved before rollups were maintained
+            rebuild_rollups(user_id)
+            monthly = get_rollups(user_id, "month", start_date)
+        if not monthly:
+            return "week", pd.DataFrame()
+
+        resolution = choose_resolution(start_date or monthly[0]["period"], today)
+        docs = monthly if resolution == "month" else get_rollups(user_id, resolution, start_date)
+        return resolution, rollup_frame(docs, resolution, start_date)
+
+    version = snapshot_version(user_id) if use_snapshot else None
+    return frame_cache.get_or_compute(user_id, ("rollup", start_date, use_snapshot, today), compute, version)
+
+def get_training_load_data(user_id, start_date=None):
+    """
+    Return the user's daily training load frame (load, CTL, ATL, TSB),
+    memoized until their data changes or the UTC day rolls over
+    """
+    today = datetime.utcnow().date()
+    return frame_cache.get_or_compute(
+        user_id, ("training_load", start_date, today),
+        lambda: get_training_load(user_id, start_date=start_date, today=today)
+    )
@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+from utils.db import ensure_rollups, get_cohort_weekly, get_rollups, get_user_activities, get_weekly_leaderboard
+from utils.rollups import ROLLUP_FIELDS, next_period, period_start, rollup_documents
+
+def _weekly_documents(user_ids, start_date=None):
+    """
+    Roll up each user's activities into weekly documents in memory; used
+    with the SQLite backend, which has no weekly_summaries collection
+    """
+    if start_date is not None:
+        # Whole weeks, like the stored rollups
+        start_date = str(period_start(np.datetime64(start_date, 'D'), "week"))
+    docs = []
+    for user_id in user_ids:
+        activities = get_user_activities(user_id, fields=ROLLUP_FIELDS, start_date=start_date)
+        if not activities:
+            continue
+        days = np.array([activity["start_date"][:10] for activity in activities], dtype='datetime64[D]')
+        start = period_start(days.min(), "week")
+        end = next_period(period_start(days.max(), "week"), "week")
+        docs.extend(rollup_documents(user_id, activities, "week", start, end))
+    return docs
+
+def _cohort_rows(docs):
+    """
+    Group per-user weekly documents by week like get_cohort_weekly does
+    """
+    rows = {}
+    for doc in docs:
+        row = rows.setdefault(doc["period"], {
+            "period": doc["period"],
+            "active_users": 0,
+            "activity_count": 0,
+            "distance": 0.0,
+            "moving_time": 0.0,
+            "max_distance": 0.0,
+        })
+        row["active_users"] += 1
+        row["activity_count"] += doc["activity_count"]
+        row["distance"] += doc["distance"]
+        row["moving_time"] += doc["moving_time"]
+        row["max_distance"] = max(row["max_distance"], doc["distance"])
+    return [rows[period] for period in sorted(rows)]
+
+def cohort_weekly(user_ids, start_date=None):
+    """
+    Return a DataFrame of weekly group statistics for the given users:
+    period_date, active_users, activity_count, total_distance_km,
+    avg_distance_km (averaged over every user in the cohort, counting
+    inactive ones as 0) and max_distance_km. Weeks without any activity
+    are filled with zeros.
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return pd.DataFrame()
+
+    ensure_rollups(user_ids)
+    rows = get_cohort_weekly(user_ids, start_date)
+    if rows is None:
+        rows = _cohort_rows(_weekly_documents(user_ids, start_date))
+    if not rows:
+        return pd.DataFrame()
+
+    df = pd.DataFrame(rows)
+    df['period_date'] = pd.to_datetime(df['period'])
+    first = df['period_date'].min()
+    if start_date is not None:
+        first = min(first, pd.Timestamp(str(period_start(np.datetime64(start_date, 'D'), "week"))))
+    weeks = pd.date_range(first, df['period_date'].max(), freq='7D')
+    df = df.set_index('period_date').reindex(weeks, fill_value=0).rename_axis('period_date').reset_index()
+
+    return pd.DataFrame({
+        'period_date': df['period_date'],
+        'active_users': df['active_users'].astype(np.int64),
+        'activity_count': df['activity_count'].astype(np.int64),
+        'total_distance_km': df['distance'] / 1000,
+        'avg_distance_km': df['distance'] / 1000 / len(user_ids),
+        'max_distance_km': df['max_distance'] / 1000,
+    })
+
+def weekly_leaderboard(user_ids, week, limit=None):
+    """
+    Rank the given users by distance in one week (any day of it). Returns
+    a DataFrame with rank, user_id, distance_km, activity_count and
+    moving_time_h; users without activities that week are left out.
+    """
+    period = str(period_start(np.datetime64(week, 'D'), "week"))
+    user_ids = list(user_ids)
+    docs = get_weekly_leaderboard(period, user_ids, limit)
+    if docs is None:
+        docs = [
+            doc for doc in _weekly_documents(user_ids, period)
+            if doc["period"] == period
+        ]
+        docs.sort(key=lambda doc: doc["distance"], reverse=True)
+        docs = docs[:limit] if limit else docs
+    if not docs:
+        return pd.DataFrame()
+
+    df = pd.DataFrame(docs)
+    return pd.DataFrame({
+        'rank': np.arange(1, len(df) + 1),
+        'user_id': df['user_id'],
+        'distance_km': df['distance'] / 1000,
+        'activity_count': df['activity_count'].astype(np.int64),
+        'moving_time_h': df['moving_time'] / 3600,
+    })
+
+def user_weekly_distance(user_id, start_date=None):
+    """
+    Return one user's weekly distance (period_date, distance_km) for
+    comparison against the cohort
+    """
+    docs = get_rollups(user_id, "week", start_date)
+    if docs is None:
+        docs = _weekly_documents([user_id], start_date)
+    if not docs:
+        return pd.DataFrame()
+    return pd.DataFrame({
+        'period_date': pd.to_datetime([doc["period"] for doc in docs]),
+        'distance_km': [doc["distance"] / 1000 for doc in docs],
+    })
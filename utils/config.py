@@ -0,0 +1,19 @@
+import os
+import streamlit as st
+from dotenv import load_dotenv
+
+# Read .env once per process; importing this module first makes its values
+# visible to every module-level os.getenv() that follows
+load_dotenv()
+
+def get_secret(name, default=None):
+    """
+    Read a setting from Streamlit secrets, falling back to the environment
+    """
+    try:
+        if name in st.secrets:
+            return st.secrets[name]
+    except Exception:
+        # No secrets file available (e.g. outside Streamlit)
+        pass
+    return os.getenv(name, default)
@@ -1,56 +1,425 @@
 import os
-from pymongo import MongoClient
-from dotenv import load_dotenv
+import threading
+import time
+from collections import deque
+from datetime import date, datetime, timezone
+from pymongo import ASCENDING, DESCENDING, IndexModel, MongoClient, UpdateOne, monitoring
+from pymongo.errors import OperationFailure
 import streamlit as st
+from utils import config, perf
+from utils.rollups import RESOLUTIONS, ROLLUP_COLLECTIONS, period_range, period_start
+from utils.sqlite_store import SQLiteStore
 
-# Load environment variables
-load_dotenv()
+# Storage backend: "mongo", "sqlite", or "auto" to use MongoDB when MONGO_URI
+# is set and the embedded SQLite database otherwise
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "auto").lower()
 
-def get_database():
+# Connection pool tuning (overridable through environment variables)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+
+# Health check settings: how often a healthy cluster is re-pinged and how
+# long to back off (exponentially, in seconds) after a failed ping
+HEALTH_CHECK_INTERVAL = 30
+BACKOFF_BASE = 2
+BACKOFF_MAX = 300
+
+# Maximum number of upserts sent in one bulk_write round-trip
+ACTIVITY_BATCH_SIZE = int(os.getenv("MONGO_BATCH_SIZE", "500"))
+
+# Seconds a user's data version is reused before it is read again, so
+# reruns skip the database; writes by other processes show up after this
+DATA_VERSION_TTL = float(os.getenv("DATA_VERSION_TTL", "5"))
+
+# Indexes backing the queries issued by this module
+INDEXES = {
+    "activities": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("user_id", ASCENDING), ("start_date", ASCENDING)], name="user_id_start_date"),
+    ],
+    "users": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+    ],
+    "activity_streams": [
+        IndexModel([("activity_id", ASCENDING), ("channel", ASCENDING)], name="activity_id_channel_unique",
+                   unique=True),
+        IndexModel([("user_id", ASCENDING), ("activity_id", ASCENDING)], name="user_id_activity_id"),
+    ],
+    "training_load": [
+        IndexModel([("user_id", ASCENDING), ("date", ASCENDING)], name="user_id_date_unique", unique=True),
+    ],
+    "daily_summaries": [
+        IndexModel([("user_id", ASCENDING), ("period", ASCENDING)], name="user_id_period_unique", unique=True),
+    ],
+    "weekly_summaries": [
+        IndexModel([("user_id", ASCENDING), ("period", ASCENDING)], name="user_id_period_unique", unique=True),
+        # Cohort views: one week across users, ranked by distance
+        IndexModel([("period", ASCENDING), ("distance", DESCENDING)], name="period_distance"),
+    ],
+    "monthly_summaries": [
+        IndexModel([("user_id", ASCENDING), ("period", ASCENDING)], name="user_id_period_unique", unique=True),
+    ],
+    "activity_curves": [
+        IndexModel([("activity_id", ASCENDING)], name="activity_id_unique", unique=True),
+        IndexModel([("user_id", ASCENDING), ("version", ASCENDING)], name="user_id_version"),
+    ],
+}
+
+class DatabaseUnavailable(Exception):
+    """
+    Raised while the selected MongoDB backend is unreachable. Nothing is
+    written anywhere else meanwhile, so the data never splits across stores.
+    """
+
+# Representative query shapes used by the app, checked by get_index_report
+APP_QUERIES = [
+    ("users", "get_user", {"user_id": 0}),
+    ("activities", "save_activities", {"id": 0}),
+    ("activities", "get_user_activities", {"user_id": 0}),
+    ("activity_streams", "get_streams", {"activity_id": 0}),
+    ("activity_streams", "stream_activity_ids", {"user_id": 0}),
+    ("activity_curves", "all_time_curves", {"user_id": 0, "version": 0}),
+    ("training_load", "get_training_load", {"user_id": 0}),
+    ("weekly_summaries", "get_rollups", {"user_id": 0}),
+    ("weekly_summaries", "get_weekly_leaderboard", {"period": ""}),
+    ("weekly_summaries", "get_cohort_weekly", {"user_id": {"$in": [0]}, "period": {"$gte": ""}}),
+]
+
+# Number of recent command latencies kept for percentile stats
+LATENCY_SAMPLES = 1000
+
+
+class _PoolStatsListener(monitoring.ConnectionPoolListener):
+    """
+    Count connection pool events for get_db_stats
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {
+            "created": 0,
+            "closed": 0,
+            "checked_out": 0,
+            "checked_in": 0,
+            "checkout_failed": 0,
+            "pool_cleared": 0,
+        }
+
+    def _incr(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._incr("pool_cleared")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._incr("created")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._incr("closed")
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._incr("checkout_failed")
+
+    def connection_checked_out(self, event):
+        self._incr("checked_out")
+
+    def connection_checked_in(self, event):
+        self._incr("checked_in")
+
+    def snapshot(self):
+        with self.lock:
+            counts = dict(self.counts)
+        counts["open"] = counts["created"] - counts["closed"]
+        counts["in_use"] = counts["checked_out"] - counts["checked_in"]
+        return counts
+
+
+class _LatencyListener(monitoring.CommandListener):
+    """
+    Record round-trip latency of every command sent to MongoDB
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = deque(maxlen=LATENCY_SAMPLES)
+        self.count = 0
+        self.failures = 0
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        with self.lock:
+            self.count += 1
+            self.samples.append(event.duration_micros / 1000)
+
+    def failed(self, event):
+        with self.lock:
+            self.count += 1
+            self.failures += 1
+            self.samples.append(event.duration_micros / 1000)
+
+    def snapshot(self):
+        with self.lock:
+            samples = sorted(self.samples)
+            count, failures = self.count, self.failures
+        stats = {"commands": count, "failed": failures}
+        if samples:
+            stats["p50_ms"] = round(samples[len(samples) // 2], 3)
+            stats["p95_ms"] = round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3)
+            stats["max_ms"] = round(samples[-1], 3)
+            stats["mean_ms"] = round(sum(samples) / len(samples), 3)
+        return stats
+
+
+# Process-wide client state. Modules are imported once per process, so this
+# is shared by every Streamlit rerun and session.
+_client = None
+_client_lock = threading.Lock()
+_pool_listener = _PoolStatsListener()
+_latency_listener = _LatencyListener()
+_indexes_ready = False
+_indexes_lock = threading.Lock()
+# Backend chosen on first use, and the SQLite store of the SQLite backend
+_backend = None
+_backend_lock = threading.Lock()
+_sqlite_store = None
+# Recently read data versions: user_id -> (version, monotonic read time)
+_data_versions = {}
+_data_versions_lock = threading.Lock()
+_health_lock = threading.Lock()
+_health = {
+    "healthy": None,  # None until the first ping
+    "failures": 0,
+    "last_check": 0.0,
+    "retry_at": 0.0,
+    "last_error": None,
+}
+
+def get_mongo_uri():
+    """
+    Read the MongoDB connection string from Streamlit secrets or the environment
+    """
+    return config.get_secret("MONGO_URI")
+
+def get_client():
     """
-    Create a connection to MongoDB and return the database
+    Return the shared MongoClient, creating it on first use
     """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MongoClient(
+                    get_mongo_uri(),
+                    maxPoolSize=MONGO_MAX_POOL_SIZE,
+                    minPoolSize=MONGO_MIN_POOL_SIZE,
+                    maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+                    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                    connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                    retryWrites=True,
+                    event_listeners=[_pool_listener, _latency_listener],
+                )
+    return _client
+
+def _check_health():
+    """
+    Ping the cluster if due and update the health state.
+    Returns True if the cluster is usable.
+    """
+    now = time.monotonic()
+    with _health_lock:
+        if _health["healthy"] is False and now < _health["retry_at"]:
+            # Still backing off, fail fast without touching the network
+            return False
+        if _health["healthy"] and now - _health["last_check"] < HEALTH_CHECK_INTERVAL:
+            return True
+
     try:
-        # First try to get from streamlit secrets
-        if hasattr(st, "secrets") and "MONGO_URI" in st.secrets:
-            mongo_uri = st.secrets["MONGO_URI"]
-        else:
-            # Fall back to env variable
-            mongo_uri = os.getenv("MONGO_URI")
-        
-        # Display connection status message
-        st.sidebar.info("Connecting to MongoDB...")
-        
-        client = MongoClient(mongo_uri)
-        
-        # Force a connection to verify it works
-        client.admin.command('ping')
-        
-        st.sidebar.success("✅ Connected to MongoDB")
-        return client.strava_data
+        with perf.span("mongo.ping"):
+            get_client().admin.command('ping')
     except Exception as e:
+        with _health_lock:
+            _health["failures"] += 1
+            delay = min(BACKOFF_BASE ** _health["failures"], BACKOFF_MAX)
+            _health.update({
+                "healthy": False,
+                "last_check": now,
+                "retry_at": now + delay,
+                "last_error": str(e),
+            })
         st.sidebar.error(f"❌ MongoDB Connection Error: {str(e)}")
         st.error(f"Failed to connect to MongoDB: {str(e)}")
-        # Create an in-memory fallback for demo purposes
-        st.warning("Using in-memory storage instead. Data will not persist after closing the app.")
+        return False
+
+    with _health_lock:
+        _health.update({
+            "healthy": True,
+            "failures": 0,
+            "last_check": now,
+            "retry_at": 0.0,
+            "last_error": None,
+        })
+    return True
+
+def get_storage_backend():
+    """
+    Return "mongo" or "sqlite", deciding once per process. In auto mode
+    only a missing MONGO_URI selects SQLite; an unreachable cluster stays
+    selected and fails fast (see DatabaseUnavailable), so data never
+    splits across the two stores.
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if STORAGE_BACKEND in ("mongo", "sqlite"):
+                    _backend = STORAGE_BACKEND
+                elif get_mongo_uri():
+                    _backend = "mongo"
+                else:
+                    _backend = "sqlite"
+    return _backend
+
+def get_sqlite_store():
+    """
+    Return the shared SQLite store, opening it on first use. Only used
+    when SQLite is the selected backend.
+    """
+    global _sqlite_store
+    if _sqlite_store is None:
+        with _backend_lock:
+            if _sqlite_store is None:
+                _sqlite_store = SQLiteStore()
+    return _sqlite_store
+
+def get_database():
+    """
+    Return the strava_data database from the shared client, or None if
+    the SQLite backend is in use. Raises DatabaseUnavailable while the
+    MongoDB backend is unreachable (failing fast during the backoff).
+    """
+    if get_storage_backend() == "sqlite":
+        return None
+    if not _check_health():
+        raise DatabaseUnavailable(get_connection_status()["last_error"])
+    db = get_client().strava_data
+    if not _indexes_ready:
+        ensure_indexes(db)
+    return db
+
+def get_connection_status():
+    """
+    Return the current MongoDB health state without touching the network
+    """
+    with _health_lock:
+        status = dict(_health)
+    if status["healthy"] is False:
+        status["retry_in"] = max(0.0, round(status["retry_at"] - time.monotonic(), 1))
+    return status
+
+def get_db_stats():
+    """
+    Return connection pool counters, command latency stats and health state
+    """
+    return {
+        "health": get_connection_status(),
+        "pool": _pool_listener.snapshot(),
+        "latency": _latency_listener.snapshot(),
+        "max_pool_size": MONGO_MAX_POOL_SIZE,
+    }
+
+def ensure_indexes(db):
+    """
+    Create the indexes in INDEXES. Runs once per process; create_indexes is
+    idempotent so it is safe when several processes start at once.
+    """
+    global _indexes_ready
+    with _indexes_lock:
+        if _indexes_ready:
+            return
+        for collection_name, indexes in INDEXES.items():
+            try:
+                db[collection_name].create_indexes(indexes)
+            except OperationFailure as e:
+                # e.g. duplicate ids already stored; the app still works without the index
+                st.warning(f"Could not create indexes on {collection_name}: {str(e)}")
+        _indexes_ready = True
+
+def _plan_stages(plan):
+    """
+    Yield every stage name in an explain() query plan tree
+    """
+    if not isinstance(plan, dict):
+        return
+    if "stage" in plan:
+        yield plan["stage"]
+    for key in ("inputStage", "queryPlan"):
+        yield from _plan_stages(plan.get(key))
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+def get_index_report():
+    """
+    Report index usage counters and warn about app queries that would
+    fall back to a collection scan
+    """
+    db = get_database()
+    if db is None:
         return None
 
+    report = {"usage": {}, "queries": [], "warnings": []}
+    for collection_name in INDEXES:
+        try:
+            stats = db[collection_name].aggregate([{"$indexStats": {}}])
+            report["usage"][collection_name] = {
+                index["name"]: index["accesses"]["ops"] for index in stats
+            }
+        except OperationFailure:
+            # $indexStats needs clusterMonitor privileges on some clusters
+            report["usage"][collection_name] = None
+
+    for collection_name, used_by, query in APP_QUERIES:
+        explain = db[collection_name].find(query).explain()
+        winning_plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+        stages = list(_plan_stages(winning_plan))
+        report["queries"].append({
+            "collection": collection_name,
+            "used_by": used_by,
+            "filter": list(query),
+            "stages": stages,
+        })
+        if "COLLSCAN" in stages:
+            report["warnings"].append(
+                f"{used_by}: query on {collection_name} by {', '.join(query)} uses a collection scan"
+            )
+
+    return report
+
 def save_user(user_id, access_token, refresh_token, expires_at):
     """
     Save or update user authentication details
     """
     db = get_database()
     if db is None:
-        # Store in session state as fallback
-        if 'users' not in st.session_state:
-            st.session_state.users = {}
-        
-        st.session_state.users[user_id] = {
-            "user_id": user_id,
-            "access_token": access_token,
-            "refresh_token": refresh_token,
-            "expires_at": expires_at
-        }
+        get_sqlite_store().save_user(user_id, access_token, refresh_token, expires_at)
         return
     
     users = db.users
@@ -75,10 +444,7 @@ def get_user(user_id):
     """
     db = get_database()
     if db is None:
-        # Retrieve from session state
-        if 'users' in st.session_state and user_id in st.session_state.users:
-            return st.session_state.users[user_id]
-        return None
+        return get_sqlite_store().get_user(user_id)
     
     users = db.users
     return users.find_one({"user_id": user_id})
@@ -89,72 +455,477 @@ def get_all_user_ids():
     """
     db = get_database()
     if db is None:
-        # Retrieve from session state
-        if 'users' in st.session_state:
-            return list(st.session_state.users.keys())
-        return []
+        return get_sqlite_store().get_all_user_ids()
     
     users = db.users
     user_records = users.find({}, {"user_id": 1})
     return [user["user_id"] for user in user_records]
 
+def get_sync_watermark(user_id):
+    """
+    Return the latest activity start_date synced for a user, or None
+    """
+    user = get_user(user_id)
+    if not user:
+        return None
+    return user.get("sync_watermark")
+
+def update_sync_watermark(user_id, start_date):
+    """
+    Advance a user's sync watermark to start_date; never moves it backwards
+    """
+    db = get_database()
+    if db is None:
+        get_sqlite_store().update_sync_watermark(user_id, start_date)
+        return
+    
+    db.users.update_one(
+        {"user_id": user_id},
+        {"$max": {"sync_watermark": start_date}},
+        upsert=True
+    )
+
+def clear_sync_watermark(user_id):
+    """
+    Forget a user's sync watermark so the next sync starts from scratch
+    """
+    db = get_database()
+    if db is None:
+        get_sqlite_store().clear_sync_watermark(user_id)
+        return
+    
+    db.users.update_one({"user_id": user_id}, {"$unset": {"sync_watermark": ""}})
+
+def get_training_load_stale_from(user_id):
+    """
+    Return the earliest day (YYYY-MM-DD) whose training load is out of
+    date because activities on or after it changed, or None
+    """
+    user = get_user(user_id)
+    if not user:
+        return None
+    return user.get("load_stale_from")
+
+def mark_training_load_stale(user_id, start_date):
+    """
+    Record that training load must be recomputed from start_date's day on;
+    only ever moves the marker earlier
+    """
+    day = start_date[:10]
+    db = get_database()
+    if db is None:
+        get_sqlite_store().mark_training_load_stale(user_id, day)
+        return
+    
+    db.users.update_one(
+        {"user_id": user_id},
+        {"$min": {"load_stale_from": day}},
+        upsert=True
+    )
+
+def clear_training_load_stale(user_id, day):
+    """
+    Clear the marker after recomputing from `day`, unless an earlier day
+    was marked meanwhile
+    """
+    db = get_database()
+    if db is None:
+        get_sqlite_store().clear_training_load_stale(user_id, day)
+        return
+    
+    db.users.update_one({"user_id": user_id, "load_stale_from": day}, {"$unset": {"load_stale_from": ""}})
+
+def get_data_version(user_id):
+    """
+    Return the user's activity data version, stored on their user document
+    so writes by any process (e.g. sync_worker.py) change it. A version
+    read less than DATA_VERSION_TTL seconds ago is reused.
+    """
+    now = time.monotonic()
+    with _data_versions_lock:
+        cached = _data_versions.get(user_id)
+    if cached is not None and now - cached[1] < DATA_VERSION_TTL:
+        return cached[0]
+    
+    db = get_database()
+    if db is None:
+        version = get_sqlite_store().get_data_version(user_id)
+    else:
+        user = db.users.find_one({"user_id": user_id}, {"_id": 0, "data_version": 1})
+        version = user.get("data_version", 0) if user else 0
+    with _data_versions_lock:
+        _data_versions[user_id] = (version, now)
+    return version
+
+def bump_data_version(user_id):
+    """
+    Mark the user's activity data as changed
+    """
+    db = get_database()
+    if db is None:
+        get_sqlite_store().bump_data_version(user_id)
+    else:
+        db.users.update_one({"user_id": user_id}, {"$inc": {"data_version": 1}}, upsert=True)
+    # This process sees its own writes at once
+    with _data_versions_lock:
+        _data_versions.pop(user_id, None)
+
 def save_activities(user_id, activities):
     """
     Save user's activities to database
     """
+    bulk_save_activities(user_id, activities)
+    return len(activities)
+
+def bulk_save_activities(user_id, activities, batch_size=None):
+    """
+    Upsert user's activities in unordered bulk writes of batch_size documents.
+    Returns a dict with inserted, modified and unchanged counts.
+    """
+    batch_size = batch_size or ACTIVITY_BATCH_SIZE
+    counts = {"inserted": 0, "modified": 0, "unchanged": 0}
+
     db = get_database()
     if db is None:
-        # Store in session state as fallback
-        if 'activities' not in st.session_state:
-            st.session_state.activities = {}
-        
-        if user_id not in st.session_state.activities:
-            st.session_state.activities[user_id] = []
-        
-        # Add user_id to each activity and store in session
-        for activity in activities:
-            activity["user_id"] = user_id
-            # Use activity id as key
-            activity_id = activity["id"]
-            
-            # Check if it exists already
-            exists = False
-            for i, existing in enumerate(st.session_state.activities[user_id]):
-                if existing.get("id") == activity_id:
-                    st.session_state.activities[user_id][i] = activity
-                    exists = True
-                    break
-            
-            if not exists:
-                st.session_state.activities[user_id].append(activity)
-        
-        return len(activities)
+        # One SQLite transaction per batch; rollups are computed when read
+        with perf.span("sqlite.save"):
+            counts, changed_from, _ = get_sqlite_store().save_activities(user_id, activities, batch_size)
+        if changed_from:
+            mark_training_load_stale(user_id, changed_from)
+            bump_data_version(user_id)
+        return counts
     
     activities_collection = db.activities
+    changed_from = changed_to = None
     
-    for activity in activities:
-        # Add user_id to each activity for reference
-        activity["user_id"] = user_id
+    for i in range(0, len(activities), batch_size):
+        batch = activities[i:i + batch_size]
+        # Dates of activities being re-saved, in case a start_date was edited
+        previous_dates = [
+            doc["start_date"] for doc in activities_collection.find(
+                {"id": {"$in": [activity["id"] for activity in batch]}}, {"_id": 0, "start_date": 1}
+            ) if doc.get("start_date")
+        ]
+        operations = []
+        for activity in batch:
+            # Update if exists, insert if not; add user_id for reference
+            operations.append(UpdateOne(
+                {"id": activity["id"]},
+                {"$set": dict(activity, user_id=user_id)},
+                upsert=True
+            ))
         
-        # Update if exists, insert if not
-        activities_collection.update_one(
-            {"id": activity["id"]},
-            {"$set": activity},
-            upsert=True
-        )
+        with perf.span("mongo.bulk_write"):
+            result = activities_collection.bulk_write(operations, ordered=False)
+        counts["inserted"] += result.upserted_count
+        counts["modified"] += result.modified_count
+        counts["unchanged"] += result.matched_count - result.modified_count
+        if result.upserted_count or result.modified_count:
+            # The batch changed something; its first and last days bound what changed
+            batch_dates = [activity["start_date"] for activity in batch] + previous_dates
+            batch_from, batch_to = min(batch_dates), max(batch_dates)
+            if not changed_from or batch_from < changed_from:
+                changed_from = batch_from
+            if not changed_to or batch_to > changed_to:
+                changed_to = batch_to
     
-    return len(activities)
+    if changed_from:
+        refresh_rollups(user_id, changed_from, changed_to)
+        mark_training_load_stale(user_id, changed_from)
+        bump_data_version(user_id)
+    return counts
+
+def save_activity_stream(user_id, activities, batch_size=None, on_batch=None):
+    """
+    Consume an iterable of activities and save it in fixed-size batches, so
+    at most batch_size activities are held at once. on_batch(batch, counts)
+    is called after each batch is written. Returns the summed counts.
+    """
+    batch_size = batch_size or ACTIVITY_BATCH_SIZE
+    totals = {"inserted": 0, "modified": 0, "unchanged": 0}
+    
+    batch = []
+    for activity in activities:
+        batch.append(activity)
+        if len(batch) < batch_size:
+            continue
+        _save_stream_batch(user_id, batch, totals, on_batch)
+        batch = []
+    if batch:
+        _save_stream_batch(user_id, batch, totals, on_batch)
+    
+    return totals
 
-def get_user_activities(user_id):
+def _save_stream_batch(user_id, batch, totals, on_batch):
+    counts = bulk_save_activities(user_id, batch, batch_size=len(batch))
+    for key in totals:
+        totals[key] += counts[key]
+    if on_batch:
+        on_batch(batch, counts)
+
+def _to_iso(value):
     """
-    Retrieve all activities for a specific user
+    Format a date/datetime bound the way Strava stores start_date
+    """
+    if value is None or isinstance(value, str):
+        return value
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, datetime.min.time())
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def get_user_activities(user_id, fields=None, start_date=None, end_date=None):
+    """
+    Retrieve activities for a specific user.
+    fields limits the returned keys; start_date (inclusive) and end_date
+    (exclusive) bound the activity start_date.
     """
     db = get_database()
     if db is None:
-        # Retrieve from session state
-        if 'activities' in st.session_state and user_id in st.session_state.activities:
-            return st.session_state.activities[user_id]
-        return []
+        with perf.span("sqlite.find"):
+            return get_sqlite_store().get_user_activities(user_id, fields, _to_iso(start_date), _to_iso(end_date))
+    
+    query = _date_range_query(user_id, start_date, end_date)
+    
+    projection = None
+    if fields:
+        projection = {field: 1 for field in fields}
+        projection.setdefault("_id", 0)
     
     activities_collection = db.activities
-    return list(activities_collection.find({"user_id": user_id})) 
\ No newline at end of file
+    # Documents are fetched and BSON-decoded while the cursor is drained
+    with perf.span("mongo.find"):
+        return list(activities_collection.find(query, projection))
+
+def _date_range_query(user_id, start_date=None, end_date=None):
+    """
+    Build the find/$match filter for a user's activities in a date window
+    """
+    start_date, end_date = _to_iso(start_date), _to_iso(end_date)
+    query = {"user_id": user_id}
+    if start_date or end_date:
+        query["start_date"] = {}
+        if start_date:
+            query["start_date"]["$gte"] = start_date
+        if end_date:
+            query["start_date"]["$lt"] = end_date
+    return query
+
+def _rollup_pipeline(user_id, resolution, start, end):
+    """
+    Build the pipeline that sums a user's activities per period of a
+    resolution for periods in [start, end). Weekly groups are keyed by
+    ISO week; day and month groups by their first day.
+    """
+    started = {"$dateFromString": {"dateString": "$start_date"}}
+    period = {
+        "day": {"$substrBytes": ["$start_date", 0, 10]},
+        "week": {"week_year": {"$isoWeekYear": started}, "week": {"$isoWeek": started}},
+        "month": {"$concat": [{"$substrBytes": ["$start_date", 0, 7]}, "-01"]},
+    }[resolution]
+    distance = {"$ifNull": ["$distance", 0]}
+    has_velocity = {"$gt": ["$moving_time", 0]}
+    return [
+        {"$match": {"user_id": user_id, "start_date": {"$gte": str(start), "$lt": str(end)}}},
+        {"$group": {
+            "_id": period,
+            "activity_count": {"$sum": 1},
+            "distance": {"$sum": distance},
+            "moving_time": {"$sum": {"$ifNull": ["$moving_time", 0]}},
+            "velocity_sum": {"$sum": {"$cond": [
+                has_velocity,
+                {"$divide": [{"$multiply": [distance, 3.6]}, "$moving_time"]},
+                0,
+            ]}},
+            "velocity_count": {"$sum": {"$cond": [has_velocity, 1, 0]}},
+        }},
+    ]
+
+def refresh_rollups(user_id, first_date, last_date):
+    """
+    Recompute the user's daily, weekly and monthly rollups for every period
+    touching first_date..last_date. The sums are grouped inside MongoDB, so
+    only one row per period comes back, never the activities themselves.
+    """
+    db = get_database()
+    if db is None:
+        # Without MongoDB rollups are computed when read
+        return
+    
+    for resolution in RESOLUTIONS:
+        start, end = period_range(first_date[:10], last_date[:10], resolution)
+        with perf.span("mongo.aggregate"):
+            groups = list(db.activities.aggregate(_rollup_pipeline(user_id, resolution, start, end)))
+        docs = []
+        for group in groups:
+            doc = {
+                "user_id": user_id,
+                "period": group["_id"],
+                "activity_count": int(group["activity_count"]),
+                "distance": float(group["distance"]),
+                "moving_time": float(group["moving_time"]),
+                "velocity_sum": float(group["velocity_sum"]),
+                "velocity_count": int(group["velocity_count"]),
+            }
+            if resolution == "week":
+                # Weekly documents also carry their ISO week for cohort views
+                week_year, week = group["_id"]["week_year"], group["_id"]["week"]
+                doc.update(
+                    period=date.fromisocalendar(week_year, week, 1).isoformat(),
+                    week_year=week_year,
+                    week=week,
+                )
+            docs.append(doc)
+        
+        collection = db[ROLLUP_COLLECTIONS[resolution]]
+        if docs:
+            collection.bulk_write([
+                UpdateOne({"user_id": user_id, "period": doc["period"]}, {"$set": doc}, upsert=True)
+                for doc in docs
+            ], ordered=False)
+        # Periods in the range that no longer have activities
+        collection.delete_many({
+            "user_id": user_id,
+            "period": {"$gte": str(start), "$lt": str(end), "$nin": [doc["period"] for doc in docs]},
+        })
+
+def rebuild_rollups(user_id):
+    """
+    Recompute all of the user's rollups, e.g. for activities saved before
+    rollups existed, and mark them as built. Returns False if the user has
+    no activities.
+    """
+    db = get_database()
+    if db is None:
+        return False
+    
+    first = db.activities.find_one({"user_id": user_id}, {"start_date": 1}, sort=[("start_date", 1)])
+    last = db.activities.find_one({"user_id": user_id}, {"start_date": 1}, sort=[("start_date", -1)])
+    if first:
+        refresh_rollups(user_id, first["start_date"], last["start_date"])
+    # From here on every save refreshes the periods it touches
+    db.users.update_one({"user_id": user_id}, {"$set": {"rollups_built": True}}, upsert=True)
+    return first is not None
+
+def rollups_built(user_id):
+    """
+    Return whether the user's rollups cover all their activities, i.e.
+    rebuild_rollups ran for them at least once. Incremental refreshes
+    alone only cover the periods saved since rollups were introduced.
+    """
+    user = get_user(user_id)
+    return bool(user and user.get("rollups_built"))
+
+def get_rollups(user_id, resolution, start_date=None, end_date=None):
+    """
+    Return the user's stored rollup documents at a resolution ("day",
+    "week" or "month"), oldest first, for periods starting in
+    [start_date, end_date). Returns None with the SQLite backend so
+    the caller can roll up in pandas instead.
+    """
+    db = get_database()
+    if db is None:
+        return None
+    
+    query = {"user_id": user_id}
+    start_date, end_date = _to_iso(start_date), _to_iso(end_date)
+    if start_date or end_date:
+        query["period"] = {}
+        if start_date:
+            query["period"]["$gte"] = start_date[:10]
+        if end_date:
+            query["period"]["$lt"] = end_date[:10]
+    
+    collection = db[ROLLUP_COLLECTIONS[resolution]]
+    with perf.span("mongo.find"):
+        return list(collection.find(query, {"_id": 0, "user_id": 0}).sort("period", ASCENDING))
+
+def ensure_rollups(user_ids):
+    """
+    Rebuild the rollups of any of the given users whose rollups were never
+    fully built (see rollups_built)
+    """
+    db = get_database()
+    if db is None:
+        return
+    
+    built = set(db.users.distinct("user_id", {"user_id": {"$in": list(user_ids)}, "rollups_built": True}))
+    for user_id in user_ids:
+        if user_id not in built:
+            rebuild_rollups(user_id)
+
+def get_cohort_weekly(user_ids, start_date=None, end_date=None):
+    """
+    Aggregate the weekly_summaries of a group of users per ISO week, reading
+    only one small document per user and week. Returns rows with period,
+    active_users, activity_count, distance, moving_time and max_distance,
+    or None with the SQLite backend.
+    """
+    db = get_database()
+    if db is None:
+        return None
+    
+    match = {"user_id": {"$in": list(user_ids)}}
+    start_date, end_date = _to_iso(start_date), _to_iso(end_date)
+    if start_date or end_date:
+        match["period"] = {}
+        if start_date:
+            # Include the whole week containing start_date
+            match["period"]["$gte"] = str(period_start(start_date[:10], "week"))
+        if end_date:
+            match["period"]["$lt"] = end_date[:10]
+    
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": "$period",
+            "active_users": {"$sum": 1},
+            "activity_count": {"$sum": "$activity_count"},
+            "distance": {"$sum": "$distance"},
+            "moving_time": {"$sum": "$moving_time"},
+            "max_distance": {"$max": "$distance"},
+        }},
+        {"$project": {
+            "_id": 0,
+            "period": "$_id",
+            "active_users": 1,
+            "activity_count": 1,
+            "distance": 1,
+            "moving_time": 1,
+            "max_distance": 1,
+        }},
+        {"$sort": {"period": 1}},
+    ]
+    with perf.span("mongo.aggregate"):
+        return list(db.weekly_summaries.aggregate(pipeline))
+
+def get_weekly_leaderboard(period, user_ids=None, limit=None):
+    """
+    Return the weekly_summaries of one week (period = its Monday,
+    YYYY-MM-DD) ranked by distance, optionally limited to some users.
+    Returns None with the SQLite backend.
+    """
+    db = get_database()
+    if db is None:
+        return None
+    
+    query = {"period": period}
+    if user_ids is not None:
+        query["user_id"] = {"$in": list(user_ids)}
+    
+    cursor = db.weekly_summaries.find(query, {"_id": 0}).sort("distance", DESCENDING)
+    if limit:
+        cursor = cursor.limit(limit)
+    with perf.span("mongo.find"):
+        return list(cursor)
+
+def count_user_activities(user_id):
+    """
+    Count stored activities for a specific user without fetching them
+    """
+    db = get_database()
+    if db is None:
+        return get_sqlite_store().count_user_activities(user_id)
+    
+    return db.activities.count_documents({"user_id": user_id})
@@ -0,0 +1,220 @@
+import numpy as np
+from pymongo import UpdateOne
+from utils import perf
+from utils.db import get_database, get_sqlite_store, get_user_activities
+from utils.streams import get_streams, stream_activity_ids
+
+# Window lengths (seconds) of the mean-maximal curves, ascending
+DURATIONS = [1, 5, 10, 15, 30, 60, 120, 180, 300, 600, 1200, 1800, 3600, 5400, 7200, 10800, 14400]
+
+# Standard best-effort distances in metres, shortest first
+EFFORT_DISTANCES = {
+    "400m": 400,
+    "1/2 mile": 805,
+    "1k": 1000,
+    "1 mile": 1609,
+    "2 mile": 3219,
+    "5k": 5000,
+    "10k": 10000,
+    "15k": 15000,
+    "10 mile": 16093,
+    "20k": 20000,
+    "Half-Marathon": 21097,
+    "30k": 30000,
+    "Marathon": 42195,
+}
+
+# Mean-maximal curves kept per activity: power (W), heart rate (bpm), speed (km/h)
+CURVE_CHANNELS = ("watts", "heartrate", "speed")
+
+# Bump when DURATIONS, EFFORT_DISTANCES or the maths change so cached
+# per-activity curves are recomputed
+CURVES_VERSION = 1
+
+def resample_1hz(time, values, fill="ffill"):
+    """
+    Put samples on a 1-second grid starting at time[0]. Strava skips
+    seconds while auto-paused; gaps are forward-filled, or zero-filled
+    with fill="zero" (power is 0 while stopped).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    time = np.asarray(time, dtype=np.int64)
+    if len(time) == 0:
+        return values
+    time = time - time[0]
+    if time[-1] + 1 == len(time):
+        # Already one sample per second
+        return values
+    if fill == "zero":
+        grid = np.zeros(time[-1] + 1)
+        grid[time] = values
+        return grid
+    return values[np.searchsorted(time, np.arange(time[-1] + 1), side="right") - 1]
+
+def _window_max(prefix, durations=DURATIONS):
+    """
+    Best mean over every window of each duration, from prefix sums
+    (prefix[i] = sum of the first i samples). NaN where the activity is
+    shorter than the duration.
+    """
+    curve = np.full(len(durations), np.nan)
+    n = len(prefix) - 1
+    for k, duration in enumerate(durations):
+        if duration > n:
+            break
+        curve[k] = (prefix[duration:] - prefix[:-duration]).max() / duration
+    return curve
+
+def mean_max(values, durations=DURATIONS):
+    """
+    Mean-maximal curve of a 1 Hz series: for each duration, the highest
+    average over any window of that many seconds. O(n) per duration.
+    """
+    prefix = np.concatenate(([0.0], np.cumsum(values, dtype=np.float64)))
+    return _window_max(prefix, durations)
+
+def best_efforts(time, distance, distances=EFFORT_DISTANCES):
+    """
+    Fastest elapsed time (seconds) to cover each distance within one
+    activity, or NaN when the activity is shorter
+    """
+    time = np.asarray(time, dtype=np.float64)
+    distance = np.asarray(distance, dtype=np.float64)
+    efforts = np.full(len(distances), np.nan)
+    if len(distance) < 2:
+        return efforts
+    for k, target in enumerate(distances.values()):
+        if distance[-1] - distance[0] < target:
+            break
+        # For each start sample, the first sample at least `target` metres on
+        end = np.searchsorted(distance, distance + target, side="left")
+        valid = end < len(distance)
+        efforts[k] = (time[end[valid]] - time[valid]).min()
+    return efforts
+
+@perf.timed("activity_curves")
+def compute_curves(streams):
+    """
+    Mean-maximal curves and best efforts of one activity's streams
+    ({channel: array}). Channels the activity lacks give all-NaN curves.
+    """
+    time = streams.get("time")
+    empty = np.full(len(DURATIONS), np.nan)
+    curves = {channel: empty for channel in CURVE_CHANNELS}
+    efforts = np.full(len(EFFORT_DISTANCES), np.nan)
+    if time is None or len(time) == 0:
+        return curves, efforts
+
+    if "watts" in streams:
+        curves["watts"] = mean_max(resample_1hz(time, streams["watts"], fill="zero"))
+    if "heartrate" in streams:
+        curves["heartrate"] = mean_max(resample_1hz(time, streams["heartrate"]))
+    if "distance" in streams:
+        # Cumulative distance already is the prefix sum of speed
+        distance = resample_1hz(time, streams["distance"])
+        curves["speed"] = _window_max(distance - distance[0]) * 3.6
+        efforts = best_efforts(time, streams["distance"])
+    return curves, efforts
+
+def _curves_doc(user_id, activity, streams):
+    curves, efforts = compute_curves(streams)
+    return {
+        "activity_id": activity["id"],
+        "user_id": user_id,
+        "sport_type": activity.get("sport_type"),
+        "start_date": activity.get("start_date"),
+        "version": CURVES_VERSION,
+        "curves": {channel: curve.tolist() for channel, curve in curves.items()},
+        "best_efforts": efforts.tolist(),
+    }
+
+def save_activity_curves(user_id, activity, streams):
+    """
+    Compute and cache the curves of one activity (a dict with at least
+    "id"; sport_type and start_date are kept for filtering)
+    """
+    doc = _curves_doc(user_id, activity, streams)
+    _save_curves_docs([doc])
+    return doc
+
+def _cached_curves(user_id):
+    """
+    Return {activity_id: curves doc} of the user's up-to-date cached curves
+    """
+    db = get_database()
+    if db is None:
+        return get_sqlite_store().get_curves(user_id, CURVES_VERSION)
+
+    docs = db.activity_curves.find({"user_id": user_id, "version": CURVES_VERSION}, {"_id": 0})
+    return {doc["activity_id"]: doc for doc in docs}
+
+def _save_curves_docs(docs):
+    db = get_database()
+    if db is None:
+        get_sqlite_store().save_curves(docs)
+        return
+    if docs:
+        db.activity_curves.bulk_write([
+            UpdateOne({"activity_id": doc["activity_id"]}, {"$set": doc}, upsert=True) for doc in docs
+        ], ordered=False)
+
+def get_activity_curves(user_id, activity_ids):
+    """
+    Return curves docs for the given activities, computing (from stored
+    streams) and caching any that are missing or outdated
+    """
+    cached = _cached_curves(user_id)
+    missing = [activity_id for activity_id in activity_ids if activity_id not in cached]
+    if missing:
+        wanted = set(missing)
+        activities = {
+            activity["id"]: activity
+            for activity in get_user_activities(user_id, fields=["id", "sport_type", "start_date"])
+            if activity["id"] in wanted
+        }
+        docs = []
+        for activity_id in missing:
+            streams = get_streams(activity_id)
+            if streams:
+                docs.append(_curves_doc(user_id, activities.get(activity_id, {"id": activity_id}), streams))
+        _save_curves_docs(docs)
+        cached.update({doc["activity_id"]: doc for doc in docs})
+    return [cached[activity_id] for activity_id in activity_ids if activity_id in cached]
+
+def all_time_curves(user_id, sport_types=None, start_date=None):
+    """
+    Combine cached per-activity curves into the user's best-ever curves:
+    an element-wise max of the mean-maximal curves and min of the best
+    efforts. Returns {"durations", "curves", "curve_activities",
+    "distances", "best_efforts", "effort_activities"}, where the
+    *_activities entries give the activity id behind each point (None
+    where no activity reaches that duration/distance).
+    """
+    docs = get_activity_curves(user_id, sorted(stream_activity_ids(user_id)))
+    if sport_types:
+        docs = [doc for doc in docs if doc.get("sport_type") in sport_types]
+    if start_date:
+        start_date = start_date.isoformat() if hasattr(start_date, "isoformat") else start_date
+        docs = [doc for doc in docs if (doc.get("start_date") or "") >= start_date]
+
+    ids = np.array([doc["activity_id"] for doc in docs])
+    result = {"durations": DURATIONS, "distances": list(EFFORT_DISTANCES), "curves": {}, "curve_activities": {}}
+    for channel in CURVE_CHANNELS:
+        stack = np.array([doc["curves"][channel] for doc in docs], dtype=np.float64).reshape(len(docs), len(DURATIONS))
+        result["curves"][channel], result["curve_activities"][channel] = _reduce(stack, ids, np.fmax, -np.inf)
+    stack = np.array([doc["best_efforts"] for doc in docs], dtype=np.float64).reshape(len(docs), len(EFFORT_DISTANCES))
+    result["best_efforts"], result["effort_activities"] = _reduce(stack, ids, np.fmin, np.inf)
+    return result
+
+def _reduce(stack, ids, ufunc, worst):
+    """
+    Element-wise best of a (activities x points) stack, ignoring NaN, and
+    the activity id achieving each point
+    """
+    if len(stack) == 0:
+        return np.full(stack.shape[1], np.nan), [None] * stack.shape[1]
+    best = ufunc.reduce(stack, axis=0)
+    filled = np.where(np.isnan(stack), worst, stack)
+    index = filled.argmax(axis=0) if ufunc is np.fmax else filled.argmin(axis=0)
+    activities = [None if np.isnan(value) else ids[i].item() for value, i in zip(best, index)]
+    return best, activities
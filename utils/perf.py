@@ -0,0 +1,251 @@
+import importlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Timing is off unless PERF_TIMING is set; otherwise only requests that
+# ask for it (the perf panel's script runs) are timed
+_enabled = os.getenv("PERF_TIMING", "").lower() in ("1", "true", "yes")
+
+# Emit one JSON log line per request when PERF_LOG_JSON is set
+LOG_JSON = os.getenv("PERF_LOG_JSON", "").lower() in ("1", "true", "yes")
+
+# Serve Prometheus text metrics on this port when set
+METRICS_PORT = os.getenv("PERF_METRICS_PORT")
+
+# Number of recent durations kept per span for percentiles
+HISTOGRAM_SAMPLES = 1000
+
+logger = logging.getLogger("perf")
+
+class _Histogram:
+    def __init__(self):
+        self.samples = deque(maxlen=HISTOGRAM_SAMPLES)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def snapshot(self):
+        samples = sorted(self.samples)
+        return {
+            "count": self.count,
+            "total_ms": self.total * 1000,
+            "p50_ms": samples[len(samples) // 2] * 1000,
+            "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000,
+            "max_ms": self.max * 1000,
+        }
+
+_lock = threading.Lock()
+_histograms = {}
+# Seconds taken by the first import of each lazily loaded module
+_import_times = {}
+# Spans of the request (Streamlit script run) executing on this thread
+_local = threading.local()
+
+def is_enabled():
+    """
+    Whether spans are recorded on this thread: always with PERF_TIMING,
+    otherwise only inside a request begun with enabled=True
+    """
+    return _enabled or getattr(_local, "enabled", False)
+
+def record(name, seconds):
+    """
+    Add one duration to the process histogram and the current request
+    """
+    spans = getattr(_local, "spans", None)
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = _Histogram()
+        histogram.add(seconds)
+        # Under the lock: worker threads may share the request's spans
+        if spans is not None:
+            count, total = spans.get(name, (0, 0.0))
+            spans[name] = (count + 1, total + seconds)
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.start)
+        return False
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NOOP = _NoopSpan()
+
+def span(name):
+    """
+    Context manager timing a block under `name`; a shared no-op when disabled
+    """
+    if not (_enabled or getattr(_local, "enabled", False)):
+        return _NOOP
+    return _Span(name)
+
+def timed(name):
+    """
+    Decorator timing every call of a function under `name`
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not (_enabled or getattr(_local, "enabled", False)):
+                return fn(*args, **kwargs)
+            with _Span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def begin_request(enabled=False):
+    """
+    Start collecting spans for the request running on this thread. With
+    enabled, this request is timed even when PERF_TIMING is off.
+    """
+    _local.enabled = enabled
+    _local.spans = {} if is_enabled() else None
+    _local.started = time.perf_counter()
+
+def propagate(fn):
+    """
+    Wrap fn to run in a worker thread with the calling thread's request
+    context, so its spans are recorded (when this request is timed) and
+    counted in this request's spans
+    """
+    enabled = getattr(_local, "enabled", False)
+    spans = getattr(_local, "spans", None)
+    if not enabled and spans is None:
+        return fn
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        previous = getattr(_local, "enabled", False), getattr(_local, "spans", None)
+        _local.enabled, _local.spans = enabled, spans
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.enabled, _local.spans = previous
+    return wrapper
+
+def end_request():
+    """
+    Finish the current request: record its total time, log it as JSON if
+    configured, and return {span: {count, total_ms}} for the request
+    """
+    spans = getattr(_local, "spans", None)
+    _local.spans = None
+    _local.enabled = False
+    if spans is None:
+        return None
+
+    record("request", time.perf_counter() - _local.started)
+    summary = {name: {"count": count, "total_ms": total * 1000} for name, (count, total) in spans.items()}
+    if LOG_JSON:
+        logger.info(json.dumps({"event": "request", "spans": summary}))
+    return summary
+
+def timed_import(module_name):
+    """
+    Import a module on first use, remembering how long that took (also
+    while timing is off) and recording it as an "import.<module>" span
+    """
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    seconds = time.perf_counter() - start
+    with _lock:
+        _import_times[module_name] = seconds
+    if is_enabled():
+        record(f"import.{module_name}", seconds)
+    return module
+
+def import_times():
+    """
+    Return {module: ms} for the modules loaded through timed_import
+    """
+    with _lock:
+        return {name: seconds * 1000 for name, seconds in _import_times.items()}
+
+def histograms():
+    """
+    Return p50/p95/max per span name across recent requests
+    """
+    with _lock:
+        return {name: histogram.snapshot() for name, histogram in sorted(_histograms.items())}
+
+def prometheus_text():
+    """
+    Render the span histograms in the Prometheus text exposition format
+    """
+    lines = [
+        "# HELP strava_dashboard_span_seconds Duration of instrumented hot paths",
+        "# TYPE strava_dashboard_span_seconds summary",
+    ]
+    for name, stats in histograms().items():
+        label = f'span="{name}"'
+        lines.append(f'strava_dashboard_span_seconds{{{label},quantile="0.5"}} {stats["p50_ms"] / 1000:.6f}')
+        lines.append(f'strava_dashboard_span_seconds{{{label},quantile="0.95"}} {stats["p95_ms"] / 1000:.6f}')
+        lines.append(f'strava_dashboard_span_seconds_sum{{{label}}} {stats["total_ms"] / 1000:.6f}')
+        lines.append(f'strava_dashboard_span_seconds_count{{{label}}} {stats["count"]}')
+    return "\n".join(lines) + "\n"
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+_metrics_server = None
+
+def start_metrics_server(port=None):
+    """
+    Serve /metrics in a background thread (once per process)
+    """
+    global _metrics_server
+    port = port or METRICS_PORT
+    if _metrics_server is not None or not port:
+        return _metrics_server
+    with _lock:
+        if _metrics_server is None:
+            server = ThreadingHTTPServer(("0.0.0.0", int(port)), _MetricsHandler)
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            _metrics_server = server
+    return _metrics_server
@@ -0,0 +1,243 @@
+import os
+import random
+import threading
+import time
+import requests
+
+# Strava rate limits: a short window resetting every 15 minutes (on the
+# quarter hour) and a daily window resetting at midnight UTC
+SHORT_WINDOW = 15 * 60
+DAILY_WINDOW = 24 * 60 * 60
+
+# Limits assumed until the first response tells us the real ones
+DEFAULT_SHORT_LIMIT = int(os.getenv("STRAVA_SHORT_LIMIT", "100"))
+DEFAULT_DAILY_LIMIT = int(os.getenv("STRAVA_DAILY_LIMIT", "1000"))
+
+# Token bucket burst size; the bucket refills at short_limit / SHORT_WINDOW
+BURST = int(os.getenv("STRAVA_BURST", "20"))
+
+# Retry settings for 429 and 5xx responses
+MAX_RETRIES = 4
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+# Maximum number of Strava requests in flight at once, across all users
+MAX_CONCURRENCY = int(os.getenv("STRAVA_MAX_CONCURRENCY", "8"))
+
+# Longest a request will wait for budget before giving up (seconds)
+DEFAULT_MAX_WAIT = float(os.getenv("STRAVA_MAX_WAIT", "60"))
+
+# Connect and read timeout of each Strava request (seconds), so a stalled
+# connection cannot hold one of the MAX_CONCURRENCY slots forever
+REQUEST_TIMEOUT = float(os.getenv("STRAVA_TIMEOUT", "30"))
+
+# Response headers for the overall and read-only budgets
+LIMIT_HEADERS = {
+    "overall": ("X-RateLimit-Limit", "X-RateLimit-Usage"),
+    "read": ("X-ReadRateLimit-Limit", "X-ReadRateLimit-Usage"),
+}
+
+class RateLimitExceeded(requests.RequestException):
+    """
+    Raised when the Strava budget is exhausted for longer than a caller will wait
+    """
+    def __init__(self, message, retry_in):
+        super().__init__(message)
+        self.retry_in = retry_in
+
+def _window_start(now, window):
+    return now - (now % window)
+
+def _parse_pair(value):
+    try:
+        short, daily = (int(part) for part in value.split(","))
+        return short, daily
+    except (AttributeError, ValueError):
+        return None
+
+class RateLimitScheduler:
+    """
+    Paces every Strava request through a shared token bucket, caps the
+    number of requests in flight, tracks the short and daily budgets
+    reported in response headers, and retries 429/5xx responses with
+    jittered exponential backoff.
+    """
+    def __init__(self, short_limit=DEFAULT_SHORT_LIMIT, daily_limit=DEFAULT_DAILY_LIMIT, burst=BURST,
+                 max_concurrency=MAX_CONCURRENCY):
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.burst = burst
+        self.tokens = float(min(burst, short_limit))
+        self.refilled_at = time.monotonic()
+        self.buckets = {
+            "overall": self._new_bucket(short_limit, daily_limit),
+        }
+        self.stats = {"requests": 0, "retries": 0, "throttled": 0, "waited_s": 0.0}
+
+    def set_max_concurrency(self, max_concurrency):
+        """
+        Change the cap on requests in flight; applies to requests started afterwards
+        """
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+
+    @staticmethod
+    def _new_bucket(short_limit, daily_limit):
+        return {
+            "short_limit": short_limit,
+            "daily_limit": daily_limit,
+            "short_usage": 0,
+            "daily_usage": 0,
+            "short_window": _window_start(time.time(), SHORT_WINDOW),
+            "daily_window": _window_start(time.time(), DAILY_WINDOW),
+        }
+
+    def _short_limit(self):
+        return min(bucket["short_limit"] for bucket in self.buckets.values())
+
+    def _refill(self, now):
+        rate = self._short_limit() / SHORT_WINDOW
+        capacity = min(self.burst, self._short_limit())
+        self.tokens = min(capacity, self.tokens + (now - self.refilled_at) * rate)
+        self.refilled_at = now
+
+    def _roll_windows(self, now):
+        # Usage reported in an earlier window no longer counts
+        short_window = _window_start(now, SHORT_WINDOW)
+        daily_window = _window_start(now, DAILY_WINDOW)
+        for bucket in self.buckets.values():
+            if bucket["short_window"] != short_window:
+                bucket["short_window"] = short_window
+                bucket["short_usage"] = 0
+            if bucket["daily_window"] != daily_window:
+                bucket["daily_window"] = daily_window
+                bucket["daily_usage"] = 0
+
+    def _budget_wait(self, now):
+        """
+        Seconds until the budget allows another request (0 if it does now)
+        """
+        self._roll_windows(now)
+        wait = 0.0
+        for bucket in self.buckets.values():
+            if bucket["daily_usage"] >= bucket["daily_limit"]:
+                wait = max(wait, bucket["daily_window"] + DAILY_WINDOW - now)
+            elif bucket["short_usage"] >= bucket["short_limit"]:
+                wait = max(wait, bucket["short_window"] + SHORT_WINDOW - now)
+        return wait
+
+    def acquire(self, max_wait=DEFAULT_MAX_WAIT):
+        """
+        Block until a request may be sent. Raises RateLimitExceeded if that
+        would take longer than max_wait seconds.
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                budget_wait = self._budget_wait(time.time())
+                if budget_wait == 0:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        self.stats["requests"] += 1
+                        self.stats["waited_s"] += waited
+                        # Count the request now so concurrent callers see it
+                        for bucket in self.buckets.values():
+                            bucket["short_usage"] += 1
+                            bucket["daily_usage"] += 1
+                        return
+                    delay = (1 - self.tokens) * SHORT_WINDOW / self._short_limit()
+                else:
+                    delay = budget_wait
+                self.stats["throttled"] += 1
+
+            if waited + delay > max_wait:
+                raise RateLimitExceeded(
+                    f"Strava rate limit reached; budget available in {round(delay)}s",
+                    retry_in=delay
+                )
+            time.sleep(delay)
+            waited += delay
+
+    def update_from_headers(self, headers):
+        """
+        Record the limits and usage reported by a Strava response
+        """
+        now = time.time()
+        with self.lock:
+            self._roll_windows(now)
+            for name, (limit_header, usage_header) in LIMIT_HEADERS.items():
+                limits = _parse_pair(headers.get(limit_header))
+                usage = _parse_pair(headers.get(usage_header))
+                if not limits or not usage:
+                    continue
+                bucket = self.buckets.setdefault(name, self._new_bucket(*limits))
+                bucket["short_limit"], bucket["daily_limit"] = limits
+                bucket["short_usage"], bucket["daily_usage"] = usage
+
+    def remaining(self):
+        """
+        Return the remaining short-window and daily budget and when each resets
+        """
+        now = time.time()
+        with self.lock:
+            self._roll_windows(now)
+            buckets = list(self.buckets.values())
+            stats = dict(self.stats)
+        short_remaining = min(max(0, b["short_limit"] - b["short_usage"]) for b in buckets)
+        daily_remaining = min(max(0, b["daily_limit"] - b["daily_usage"]) for b in buckets)
+        return {
+            "short_limit": min(b["short_limit"] for b in buckets),
+            "short_remaining": short_remaining,
+            "short_reset_in": round(_window_start(now, SHORT_WINDOW) + SHORT_WINDOW - now),
+            "daily_limit": min(b["daily_limit"] for b in buckets),
+            "daily_remaining": daily_remaining,
+            "daily_reset_in": round(_window_start(now, DAILY_WINDOW) + DAILY_WINDOW - now),
+            **stats,
+        }
+
+    def request(self, session, method, url, max_wait=DEFAULT_MAX_WAIT, **kwargs):
+        """
+        Send a request through the scheduler, retrying 429/5xx responses,
+        connection errors and timeouts with jittered exponential backoff.
+        Returns the last response received.
+        """
+        kwargs.setdefault("timeout", REQUEST_TIMEOUT)
+        for attempt in range(MAX_RETRIES + 1):
+            self.acquire(max_wait=max_wait)
+            try:
+                with self.slots:
+                    response = session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == MAX_RETRIES:
+                    raise
+                self._backoff(attempt, max_wait)
+                continue
+
+            self.update_from_headers(response.headers)
+            if response.status_code != 429 and response.status_code < 500:
+                return response
+            if attempt == MAX_RETRIES:
+                return response
+
+            retry_after = response.headers.get("Retry-After")
+            if response.status_code == 429 and retry_after and retry_after.isdigit():
+                delay = float(retry_after)
+                if delay > max_wait:
+                    return response
+                with self.lock:
+                    self.stats["retries"] += 1
+                time.sleep(delay)
+            else:
+                # For 429 without Retry-After, acquire() waits for the window reset
+                self._backoff(attempt, max_wait)
+        return response
+
+    def _backoff(self, attempt, max_wait):
+        delay = min(BACKOFF_MAX, max_wait, BACKOFF_BASE * 2 ** attempt)
+        with self.lock:
+            self.stats["retries"] += 1
+        time.sleep(delay * random.uniform(0.5, 1.5))
+
+# Process-wide scheduler shared by all users and threads
+scheduler = RateLimitScheduler()
@@ -0,0 +1,207 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Rollup resolutions, finest first, and the collection each is stored in
+RESOLUTIONS = ("day", "week", "month")
+ROLLUP_COLLECTIONS = {
+    "day": "daily_summaries",
+    "week": "weekly_summaries",
+    "month": "monthly_summaries",
+}
+
+# Most points a chart trace is sent with; longer series are downsampled
+CHART_POINT_BUDGET = int(os.getenv("CHART_POINT_BUDGET", "500"))
+
+# Activity fields the rollups are built from
+ROLLUP_FIELDS = ["start_date", "distance", "moving_time"]
+
+# Monday of the first full week after the Unix epoch
+_WEEK_EPOCH = np.datetime64('1970-01-05', 'D')
+
+def period_start(days, resolution):
+    """
+    Map datetime64[D] values to the first day of their day/week/month
+    """
+    days = np.asarray(days, dtype='datetime64[D]')
+    if resolution == "day":
+        return days
+    if resolution == "week":
+        return days - (days - _WEEK_EPOCH).astype(np.int64) % 7
+    return days.astype('datetime64[M]').astype('datetime64[D]')
+
+def next_period(starts, resolution):
+    """
+    Return the first day of the period after each period start
+    """
+    starts = np.asarray(starts, dtype='datetime64[D]')
+    if resolution == "day":
+        return starts + 1
+    if resolution == "week":
+        return starts + 7
+    return (starts.astype('datetime64[M]') + 1).astype('datetime64[D]')
+
+def period_range(first_day, last_day, resolution):
+    """
+    Return (start, end) days of the whole periods covering first_day..last_day
+    """
+    start = period_start(np.datetime64(first_day, 'D'), resolution)
+    end = next_period(period_start(np.datetime64(last_day, 'D'), resolution), resolution)
+    return start, end
+
+def activity_arrays(activities):
+    """
+    Extract (days, distance m, moving time s) arrays from activity documents
+    """
+    days = np.array([activity["start_date"][:10] for activity in activities], dtype='datetime64[D]')
+    distance = np.array([activity.get("distance") or 0.0 for activity in activities], dtype=np.float64)
+    moving_time = np.array([activity.get("moving_time") or 0.0 for activity in activities], dtype=np.float64)
+    return days, distance, moving_time
+
+def frame_arrays(df):
+    """
+    Extract (days, distance m, moving time s) arrays from a prepared activity frame
+    """
+    dates = df['start_date']
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_convert('UTC').dt.tz_localize(None)
+    return (
+        dates.to_numpy().astype('datetime64[D]'),
+        df['distance'].to_numpy(dtype=np.float64, na_value=0.0),
+        df['moving_time'].to_numpy(dtype=np.float64, na_value=0.0),
+    )
+
+def rollup(days, distance, moving_time, resolution):
+    """
+    Sum activities per period. Returns a dict of per-period arrays:
+    period, activity_count, distance, moving_time, velocity_sum (km/h)
+    and velocity_count, for periods with at least one activity.
+    """
+    periods, idx = np.unique(period_start(days, resolution), return_inverse=True)
+    has_velocity = moving_time > 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        velocity = np.where(has_velocity, distance * 3.6 / moving_time, 0.0)
+    n = len(periods)
+    return {
+        "period": periods,
+        "activity_count": np.bincount(idx, minlength=n),
+        "distance": np.bincount(idx, weights=distance, minlength=n),
+        "moving_time": np.bincount(idx, weights=moving_time, minlength=n),
+        "velocity_sum": np.bincount(idx, weights=velocity, minlength=n),
+        "velocity_count": np.bincount(idx, weights=has_velocity, minlength=n).astype(np.int64),
+    }
+
+def rollup_documents(user_id, activities, resolution, start, end):
+    """
+    Build one rollup document per period in [start, end) that has activities
+    """
+    days, distance, moving_time = activity_arrays(activities)
+    inside = (days >= start) & (days < end)
+    rows = rollup(days[inside], distance[inside], moving_time[inside], resolution)
+    docs = [
+        {
+            "user_id": user_id,
+            "period": str(rows["period"][i]),
+            "activity_count": int(rows["activity_count"][i]),
+            "distance": float(rows["distance"][i]),
+            "moving_time": float(rows["moving_time"][i]),
+            "velocity_sum": float(rows["velocity_sum"][i]),
+            "velocity_count": int(rows["velocity_count"][i]),
+        }
+        for i in range(len(rows["period"]))
+    ]
+    if resolution == "week":
+        # Weekly documents also carry their ISO week for cohort views
+        iso = pd.DatetimeIndex(rows["period"]).isocalendar()
+        for doc, week_year, week in zip(docs, iso["year"], iso["week"]):
+            doc["week_year"] = int(week_year)
+            doc["week"] = int(week)
+    return docs
+
+def rollup_frame(rows, resolution, start_date=None):
+    """
+    Convert per-period rollups (a dict of arrays from rollup(), or stored
+    documents) to a chart DataFrame, filling periods without activities.
+    start_date pads the frame back to the start of the visible range.
+    """
+    if isinstance(rows, list):
+        rows = {key: np.array([doc[key] for doc in rows]) for key in (
+            "period", "activity_count", "distance", "moving_time", "velocity_sum", "velocity_count"
+        )}
+    if len(rows["period"]) == 0:
+        return pd.DataFrame()
+
+    periods = np.asarray(rows["period"], dtype='datetime64[D]')
+    first = periods.min()
+    if start_date is not None:
+        first = min(first, period_start(np.datetime64(start_date, 'D'), resolution))
+    # Every period from the first to the last, including empty ones
+    if resolution == "month":
+        months = np.arange(first.astype('datetime64[M]'), periods.max().astype('datetime64[M]') + 1)
+        all_periods = months.astype('datetime64[D]')
+    else:
+        step = 1 if resolution == "day" else 7
+        all_periods = np.arange(first, periods.max() + 1, step)
+    idx = np.searchsorted(all_periods, periods)
+
+    def scatter(key):
+        values = np.zeros(len(all_periods))
+        values[idx] = rows[key]
+        return values
+
+    velocity_count = scatter("velocity_count")
+    with np.errstate(invalid='ignore', divide='ignore'):
+        velocity_kmh = np.where(velocity_count > 0, scatter("velocity_sum") / velocity_count, np.nan)
+    return pd.DataFrame({
+        'period_date': pd.DatetimeIndex(all_periods),
+        'activity_count': scatter("activity_count").astype(np.int64),
+        'distance_km': scatter("distance") / 1000,
+        'moving_time_min': scatter("moving_time") / 60,
+        'velocity_kmh': velocity_kmh,
+        'velocity_count': velocity_count.astype(np.int64),
+    })
+
+def choose_resolution(first_day, last_day, budget=None):
+    """
+    Pick the finest resolution whose number of periods between first_day
+    and last_day fits the chart point budget
+    """
+    budget = budget or CHART_POINT_BUDGET
+    days = int((np.datetime64(last_day, 'D') - np.datetime64(first_day, 'D')).astype(np.int64)) + 1
+    if days <= budget:
+        return "day"
+    if days / 7 <= budget:
+        return "week"
+    return "month"
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets downsampling: return the indices of
+    n_out points (always including the first and last) that best keep the
+    visual shape of the series. x must be increasing; NaN y values count as 0.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.nan_to_num(np.asarray(y, dtype=np.float64))
+    # Bucket boundaries for the n - 2 inner points
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # Average of the next bucket (or the last point) is the third vertex
+        next_start, next_end = end, edges[bucket + 2] if bucket + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        area = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(area.argmax())
+        selected[bucket + 1] = previous
+    return selected
@@ -0,0 +1,183 @@
+import os
+import glob
+import threading
+import pandas as pd
+import pyarrow as pa
+from utils.visualization import ACTIVITY_FIELDS, activity_frame
+
+# Directory holding one snapshot directory per user
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", os.path.join("data", "snapshots"))
+
+# Appended parts are merged into one file once a user has more than this many
+SNAPSHOT_MAX_PARTS = 16
+
+# Arrow schema of the snapshot files (the columns prepare_activity_data uses)
+SNAPSHOT_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("type", pa.dictionary(pa.int32(), pa.string())),
+    ("sport_type", pa.dictionary(pa.int32(), pa.string())),
+    ("start_date", pa.timestamp("ns", tz="UTC")),
+    ("distance", pa.float32()),
+    ("moving_time", pa.float32()),
+    ("elapsed_time", pa.float32()),
+    ("average_heartrate", pa.float32()),
+    ("average_watts", pa.float32()),
+])
+
+# Serializes writers within this process
+_write_lock = threading.Lock()
+
+def _user_dir(user_id):
+    return os.path.join(SNAPSHOT_DIR, str(user_id))
+
+def _parts(user_id):
+    return sorted(glob.glob(os.path.join(_user_dir(user_id), "part-*.arrow")))
+
+def _next_index(parts):
+    """
+    Return the index for a new part file after the existing ones
+    """
+    if not parts:
+        return 0
+    return int(os.path.basename(parts[-1])[len("part-"):-len(".arrow")]) + 1
+
+def has_snapshot(user_id):
+    """
+    Return True if a local snapshot exists for the user
+    """
+    return bool(_parts(user_id))
+
+def snapshot_user_ids():
+    """
+    Return the ids of the users with a local snapshot, for offline mode
+    """
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return []
+    user_ids = [
+        int(name) if name.isdigit() else name
+        for name in os.listdir(SNAPSHOT_DIR) if _parts(name)
+    ]
+    return sorted(user_ids, key=str)
+
+def snapshot_version(user_id):
+    """
+    Return a value that changes whenever the user's snapshot is written
+    (part file names and modification times), or None without a snapshot
+    """
+    parts = _parts(user_id)
+    if not parts:
+        return None
+    return tuple((os.path.basename(path), os.stat(path).st_mtime_ns) for path in parts)
+
+def _to_table(activities):
+    """
+    Convert activity documents to an Arrow table in SNAPSHOT_SCHEMA
+    """
+    df = activity_frame(activities)
+    for field in ACTIVITY_FIELDS:
+        if field not in df.columns:
+            df[field] = None
+    df["type"] = df["type"].astype("category")
+    df["sport_type"] = df["sport_type"].astype("category")
+    return pa.Table.from_pandas(df[ACTIVITY_FIELDS], schema=SNAPSHOT_SCHEMA, preserve_index=False)
+
+def _write_part(user_id, table, index):
+    """
+    Atomically write one Arrow IPC part file
+    """
+    path = os.path.join(_user_dir(user_id), f"part-{index:06d}.arrow")
+    tmp_path = path + ".tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, SNAPSHOT_SCHEMA) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+    return path
+
+def _conform(table, columns=None):
+    """
+    Select columns from a part, filling any that older parts lack with nulls
+    """
+    columns = columns or SNAPSHOT_SCHEMA.names
+    if all(column in table.column_names for column in columns):
+        return table.select(columns)
+    arrays = [
+        table.column(column) if column in table.column_names
+        else pa.nulls(len(table), SNAPSHOT_SCHEMA.field(column).type)
+        for column in columns
+    ]
+    return pa.table(arrays, names=columns)
+
+def _read_table(user_id, columns=None):
+    """
+    Read all parts through memory maps, keeping only the requested columns
+    """
+    tables = []
+    for path in _parts(user_id):
+        with pa.memory_map(path, "r") as source:
+            table = pa.ipc.open_file(source).read_all()
+            tables.append(_conform(table, columns))
+    if not tables:
+        return None
+    return pa.concat_tables(tables)
+
+def read_snapshot(user_id, columns=None, start_date=None):
+    """
+    Read a user's snapshot as a DataFrame of ACTIVITY_SCHEMA columns.
+    Only the requested columns are read from disk; start_date filters
+    activities starting on or after it. Returns None if there is no snapshot.
+    """
+    columns = list(columns or ACTIVITY_FIELDS)
+    for required in ("id", "start_date"):
+        if required not in columns:
+            columns.append(required)
+
+    table = _read_table(user_id, columns)
+    if table is None:
+        return None
+
+    df = table.to_pandas()
+    # Later parts hold newer copies of re-synced activities
+    df = df.drop_duplicates("id", keep="last")
+    if start_date is not None:
+        df = df[df["start_date"] >= pd.Timestamp(start_date, tz="UTC")]
+    return df.reset_index(drop=True)
+
+def write_snapshot(user_id, activities):
+    """
+    Replace the user's snapshot with the given activities
+    """
+    with _write_lock:
+        os.makedirs(_user_dir(user_id), exist_ok=True)
+        old_parts = _parts(user_id)
+        _write_part(user_id, _to_table(activities), _next_index(old_parts))
+        for path in old_parts:
+            os.remove(path)
+
+def append_snapshot(user_id, activities):
+    """
+    Append activities to the user's snapshot as a new part file. Copies
+    of activities already in the snapshot replace the older ones when read.
+    Returns the number of activities appended.
+    """
+    if not activities:
+        return 0
+    with _write_lock:
+        os.makedirs(_user_dir(user_id), exist_ok=True)
+        parts = _parts(user_id)
+        _write_part(user_id, _to_table(activities), _next_index(parts))
+
+        if len(parts) + 1 > SNAPSHOT_MAX_PARTS:
+            _compact(user_id)
+        return len(activities)
+
+def _compact(user_id):
+    """
+    Merge all parts into one file (caller holds _write_lock)
+    """
+    parts = _parts(user_id)
+    table = _read_table(user_id)
+    df = table.to_pandas().drop_duplicates("id", keep="last")
+    merged = pa.Table.from_pandas(df, schema=SNAPSHOT_SCHEMA, preserve_index=False)
+    _write_part(user_id, merged, _next_index(parts))
+    for path in parts:
+        os.remove(path)
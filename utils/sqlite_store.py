@@ -0,0 +1,284 @@
+import json
+import os
+import sqlite3
+import threading
+
+# Location of the embedded database used when MongoDB is not
+SQLITE_PATH = os.getenv("SQLITE_PATH", os.path.join("data", "strava.db"))
+
+# Most ids bound in one IN (...) query
+SQLITE_MAX_VARIABLES = 900
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id PRIMARY KEY,
+    access_token TEXT,
+    refresh_token TEXT,
+    expires_at INTEGER,
+    sync_watermark TEXT,
+    load_stale_from TEXT,
+    data_version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS activities (
+    id PRIMARY KEY,
+    user_id NOT NULL,
+    start_date TEXT,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS activities_user_id_start_date ON activities (user_id, start_date);
+CREATE TABLE IF NOT EXISTS activity_streams (
+    activity_id NOT NULL,
+    channel TEXT NOT NULL,
+    user_id NOT NULL,
+    dtype TEXT NOT NULL,
+    length INTEGER NOT NULL,
+    codec TEXT NOT NULL,
+    payload BLOB NOT NULL,
+    PRIMARY KEY (activity_id, channel)
+);
+CREATE INDEX IF NOT EXISTS activity_streams_user_id ON activity_streams (user_id, activity_id);
+CREATE TABLE IF NOT EXISTS activity_curves (
+    activity_id PRIMARY KEY,
+    user_id NOT NULL,
+    version INTEGER NOT NULL,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS activity_curves_user_id_version ON activity_curves (user_id, version);
+CREATE TABLE IF NOT EXISTS training_load (
+    user_id NOT NULL,
+    date TEXT NOT NULL,
+    load REAL NOT NULL,
+    ctl REAL NOT NULL,
+    atl REAL NOT NULL,
+    tsb REAL NOT NULL,
+    PRIMARY KEY (user_id, date)
+);
+"""
+
+USER_COLUMNS = (
+    "user_id", "access_token", "refresh_token", "expires_at", "sync_watermark", "load_stale_from", "data_version"
+)
+STREAM_COLUMNS = ("activity_id", "channel", "user_id", "dtype", "length", "codec", "payload")
+LOAD_COLUMNS = ("user_id", "date", "load", "ctl", "atl", "tsb")
+
+def _encode(activity):
+    # Sorted keys so re-saving an identical activity gives identical text
+    return json.dumps(activity, sort_keys=True, separators=(",", ":"), default=str)
+
+class SQLiteStore:
+    """
+    Embedded storage for users, activities, streams, power/pace curves and
+    training load, used instead of MongoDB for local and edge deployments.
+    The database runs in WAL mode so readers in other threads and
+    processes (e.g. sync_worker.py) never block on a writer. Each thread
+    gets its own connection.
+    """
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        self.local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self.connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Durable at checkpoints; a crash can only lose the last transactions
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def save_user(self, user_id, access_token, refresh_token, expires_at):
+        with self.connection() as conn:
+            conn.execute(
+                "INSERT INTO users (user_id, access_token, refresh_token, expires_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET access_token = excluded.access_token, "
+                "refresh_token = excluded.refresh_token, expires_at = excluded.expires_at",
+                (user_id, access_token, refresh_token, expires_at)
+            )
+
+    def get_user(self, user_id):
+        row = self.connection().execute(
+            f"SELECT {', '.join(USER_COLUMNS)} FROM users WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        # Leave out unset fields, like a MongoDB document would
+        return {column: value for column, value in zip(USER_COLUMNS, row) if value is not None}
+
+    def get_all_user_ids(self):
+        return [row[0] for row in self.connection().execute("SELECT user_id FROM users")]
+
+    def update_sync_watermark(self, user_id, start_date):
+        with self.connection() as conn:
+            conn.execute(
+                "INSERT INTO users (user_id, sync_watermark) VALUES (?, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET sync_watermark = "
+                "max(coalesce(sync_watermark, ''), excluded.sync_watermark)",
+                (user_id, start_date)
+            )
+
+    def clear_sync_watermark(self, user_id):
+        with self.connection() as conn:
+            conn.execute("UPDATE users SET sync_watermark = NULL WHERE user_id = ?", (user_id,))
+
+    def mark_training_load_stale(self, user_id, day):
+        with self.connection() as conn:
+            conn.execute(
+                "INSERT INTO users (user_id, load_stale_from) VALUES (?, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET load_stale_from = "
+                "min(coalesce(load_stale_from, excluded.load_stale_from), excluded.load_stale_from)",
+                (user_id, day)
+            )
+
+    def clear_training_load_stale(self, user_id, day):
+        with self.connection() as conn:
+            conn.execute(
+                "UPDATE users SET load_stale_from = NULL WHERE user_id = ? AND load_stale_from = ?",
+                (user_id, day)
+            )
+
+    def bump_data_version(self, user_id):
+        with self.connection() as conn:
+            conn.execute(
+                "INSERT INTO users (user_id, data_version) VALUES (?, 1) "
+                "ON CONFLICT (user_id) DO UPDATE SET data_version = data_version + 1",
+                (user_id,)
+            )
+
+    def get_data_version(self, user_id):
+        row = self.connection().execute("SELECT data_version FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else 0
+
+    def save_activities(self, user_id, activities, batch_size):
+        """
+        Upsert activities in one transaction per batch. Returns (counts,
+        changed_from, changed_to) where the dates bound the start_dates
+        (old and new) of inserted or modified activities.
+        """
+        counts = {"inserted": 0, "modified": 0, "unchanged": 0}
+        changed_from = changed_to = None
+        conn = self.connection()
+        for i in range(0, len(activities), min(batch_size, SQLITE_MAX_VARIABLES)):
+            batch = activities[i:i + min(batch_size, SQLITE_MAX_VARIABLES)]
+            ids = [activity["id"] for activity in batch]
+            with conn:
+                stored = {
+                    row[0]: (row[1], row[2]) for row in conn.execute(
+                        f"SELECT id, start_date, doc FROM activities WHERE id IN ({', '.join('?' * len(ids))})", ids
+                    )
+                }
+                rows = []
+                for activity in batch:
+                    activity = dict(activity, user_id=user_id)
+                    doc = _encode(activity)
+                    previous = stored.get(activity["id"])
+                    if previous is None:
+                        counts["inserted"] += 1
+                    elif previous[1] == doc:
+                        counts["unchanged"] += 1
+                        continue
+                    else:
+                        counts["modified"] += 1
+                    rows.append((activity["id"], user_id, activity["start_date"], doc))
+                    dates = [activity["start_date"]] + ([previous[0]] if previous and previous[0] else [])
+                    if not changed_from or min(dates) < changed_from:
+                        changed_from = min(dates)
+                    if not changed_to or max(dates) > changed_to:
+                        changed_to = max(dates)
+                conn.executemany(
+                    "INSERT INTO activities (id, user_id, start_date, doc) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (id) DO UPDATE SET user_id = excluded.user_id, "
+                    "start_date = excluded.start_date, doc = excluded.doc",
+                    rows
+                )
+        return counts, changed_from, changed_to
+
+    def get_user_activities(self, user_id, fields=None, start_date=None, end_date=None):
+        query = "SELECT doc FROM activities WHERE user_id = ?"
+        params = [user_id]
+        if start_date:
+            query += " AND start_date >= ?"
+            params.append(start_date)
+        if end_date:
+            query += " AND start_date < ?"
+            params.append(end_date)
+        activities = [json.loads(row[0]) for row in self.connection().execute(query, params)]
+        if fields:
+            activities = [{field: a[field] for field in fields if field in a} for a in activities]
+        return activities
+
+    def count_user_activities(self, user_id):
+        return self.connection().execute("SELECT count(*) FROM activities WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+    def save_stream_channels(self, docs):
+        """
+        Upsert stream channel documents (with their payload bytes)
+        """
+        with self.connection() as conn:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO activity_streams ({', '.join(STREAM_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [tuple(doc[column] for column in STREAM_COLUMNS) for doc in docs]
+            )
+
+    def get_stream_channels(self, activity_id, channels=None):
+        query = f"SELECT {', '.join(STREAM_COLUMNS)} FROM activity_streams WHERE activity_id = ?"
+        params = [activity_id]
+        if channels is not None:
+            channels = list(channels)
+            query += f" AND channel IN ({', '.join('?' * len(channels))})"
+            params.extend(channels)
+        return [dict(zip(STREAM_COLUMNS, row)) for row in self.connection().execute(query, params)]
+
+    def stream_activity_ids(self, user_id):
+        return {
+            row[0] for row in self.connection().execute(
+                "SELECT DISTINCT activity_id FROM activity_streams WHERE user_id = ?", (user_id,)
+            )
+        }
+
+    def save_curves(self, docs):
+        with self.connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO activity_curves (activity_id, user_id, version, doc) VALUES (?, ?, ?, ?)",
+                [(doc["activity_id"], doc["user_id"], doc["version"], _encode(doc)) for doc in docs]
+            )
+
+    def get_curves(self, user_id, version):
+        return {
+            doc["activity_id"]: doc for doc in (
+                json.loads(row[0]) for row in self.connection().execute(
+                    "SELECT doc FROM activity_curves WHERE user_id = ? AND version = ?", (user_id, version)
+                )
+            )
+        }
+
+    def save_training_load(self, docs):
+        with self.connection() as conn:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO training_load ({', '.join(LOAD_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?)",
+                [tuple(doc[column] for column in LOAD_COLUMNS) for doc in docs]
+            )
+
+    def get_training_load(self, user_id, start_date=None, end_date=None):
+        """
+        Return the user's daily training load documents in [start_date,
+        end_date] (inclusive, YYYY-MM-DD), oldest first
+        """
+        query = f"SELECT {', '.join(LOAD_COLUMNS)} FROM training_load WHERE user_id = ?"
+        params = [user_id]
+        if start_date:
+            query += " AND date >= ?"
+            params.append(start_date)
+        if end_date:
+            query += " AND date <= ?"
+            params.append(end_date)
+        query += " ORDER BY date"
+        return [dict(zip(LOAD_COLUMNS, row)) for row in self.connection().execute(query, params)]
+
+    def last_training_load_day(self, user_id):
+        return self.connection().execute("SELECT max(date) FROM training_load WHERE user_id = ?", (user_id,)).fetchone()[0]
@@ -1,21 +1,84 @@
 import os
+import threading
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import requests
-from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+# Loads .env once, before the settings below are read
+from utils import config
+from utils import perf
 from utils.db import get_user, save_user
-
-# Load environment variables
-load_dotenv()
+from utils.ratelimit import RateLimitExceeded, scheduler
 
 # Strava API endpoints
 AUTH_URL = "https://www.strava.com/oauth/authorize"
 TOKEN_URL = "https://www.strava.com/oauth/token"
 ACTIVITIES_URL = "https://www.strava.com/api/v3/athlete/activities"
+STREAMS_URL = "https://www.strava.com/api/v3/activities/{activity_id}/streams"
 
 # Strava client info
 CLIENT_ID = os.getenv("STRAVA_CLIENT_ID")
 CLIENT_SECRET = os.getenv("STRAVA_CLIENT_SECRET")
 
+# Number of activity pages fetched in parallel
+FETCH_WORKERS = int(os.getenv("STRAVA_FETCH_WORKERS", "4"))
+
+# Per-second channels requested from the activity streams endpoint
+STREAM_KEYS = ("time", "distance", "heartrate", "watts", "cadence", "altitude")
+
+# Bulky activity fields the app never reads; dropped before storage
+STRIPPED_FIELDS = (
+    "map",
+    "athlete",
+    "segment_efforts",
+    "splits_metric",
+    "splits_standard",
+    "laps",
+    "best_efforts",
+    "photos",
+    "resource_state",
+)
+
+# Seconds before expiry at which an access token is treated as expired
+TOKEN_EXPIRY_BUFFER = 60
+
+# Process-level access token cache: user_id -> {access_token, expires_at}
+_token_cache = {}
+_token_cache_lock = threading.Lock()
+_refresh_locks = {}
+
+# Shared HTTP session so connections to Strava are kept alive and reused
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """
+    Return the shared requests session, creating it on first use
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=2, pool_maxsize=max(FETCH_WORKERS, 10))
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+def strava_request(method, url, **kwargs):
+    """
+    Send a request to Strava through the shared session and rate-limit scheduler
+    """
+    with perf.span("strava.http"):
+        return scheduler.request(get_session(), method, url, **kwargs)
+
+def get_rate_limit_status():
+    """
+    Return the remaining Strava API budget (short window and daily)
+    """
+    return scheduler.remaining()
+
 def get_auth_url(redirect_uri):
     """
     Generate Strava authorization URL
@@ -39,7 +102,7 @@ def exchange_code_for_token(code):
     }
     
     try:
-        response = requests.post(TOKEN_URL, data=payload)
+        response = strava_request("POST", TOKEN_URL, data=payload)
         
         if response.status_code != 200:
             return None
@@ -65,7 +128,10 @@ def refresh_access_token(refresh_token):
         'grant_type': 'refresh_token'
     }
     
-    response = requests.post(TOKEN_URL, data=payload)
+    try:
+        response = strava_request("POST", TOKEN_URL, data=payload)
+    except RateLimitExceeded:
+        return None
     if response.status_code != 200:
         return None
     
@@ -76,44 +142,252 @@ def refresh_access_token(refresh_token):
         'expires_at': token_data['expires_at']
     }
 
+def _cached_token(user_id):
+    """
+    Return the cached access token for a user if it is still valid
+    """
+    entry = _token_cache.get(user_id)
+    if entry and entry['expires_at'] > int(time.time()) + TOKEN_EXPIRY_BUFFER:
+        return entry['access_token']
+    return None
+
+def _cache_token(user_id, access_token, expires_at):
+    with _token_cache_lock:
+        _token_cache[user_id] = {'access_token': access_token, 'expires_at': expires_at}
+
+def _refresh_lock(user_id):
+    """
+    Return the lock that serializes token refreshes for a user
+    """
+    with _token_cache_lock:
+        return _refresh_locks.setdefault(user_id, threading.Lock())
+
+def invalidate_token(user_id):
+    """
+    Drop a user's cached access token, e.g. after Strava rejects it
+    """
+    with _token_cache_lock:
+        _token_cache.pop(user_id, None)
+
 def get_valid_token(user_id):
     """
-    Get a valid access token, refreshing if necessary
+    Get a valid access token, refreshing if necessary.
+    Valid tokens are served from an in-process cache; refreshes for the same
+    user are single-flight so a refresh token is never used twice.
     """
-    user = get_user(user_id)
-    if not user:
-        return None
+    access_token = _cached_token(user_id)
+    if access_token:
+        return access_token
     
-    # Check if token is expired
-    current_time = int(time.time())
+    with _refresh_lock(user_id):
+        # Another thread may have refreshed while we waited for the lock
+        access_token = _cached_token(user_id)
+        if access_token:
+            return access_token
+        
+        user = get_user(user_id)
+        if not user:
+            return None
+        
+        # If the stored token is valid (possibly refreshed by another process), use it
+        if user['expires_at'] > int(time.time()) + TOKEN_EXPIRY_BUFFER:
+            _cache_token(user_id, user['access_token'], user['expires_at'])
+            return user['access_token']
+        
+        # Token is expired, refresh it
+        token_data = refresh_access_token(user['refresh_token'])
+        if not token_data:
+            return None
+        
+        # Save the new token data, then cache it
+        save_user(user_id, token_data['access_token'], token_data['refresh_token'], token_data['expires_at'])
+        _cache_token(user_id, token_data['access_token'], token_data['expires_at'])
+        
+        return token_data['access_token']
+
+def get_activities(user_id, page=1, per_page=50, after=None, access_token=None):
+    """
+    Fetch activities from Strava API.
+    after is an epoch timestamp; only activities starting after it are
+    returned, oldest first. Pass access_token to skip the token lookup.
+    """
+    if access_token is None:
+        access_token = get_valid_token(user_id)
+    if not access_token:
+        return None
     
-    # If token is valid, return it
-    if user['expires_at'] > current_time + 60:  # Add buffer of 60 seconds
-        return user['access_token']
+    headers = {'Authorization': f'Bearer {access_token}'}
+    params = {'page': page, 'per_page': per_page}
+    if after is not None:
+        params['after'] = int(after)
     
-    # Token is expired, refresh it
-    token_data = refresh_access_token(user['refresh_token'])
-    if not token_data:
+    try:
+        response = strava_request("GET", ACTIVITIES_URL, headers=headers, params=params)
+    except RateLimitExceeded:
+        return None
+    if response.status_code == 401:
+        # Token revoked or refreshed elsewhere; look it up again next time
+        invalidate_token(user_id)
+    if response.status_code != 200:
         return None
     
-    # Save the new token data
-    save_user(user_id, token_data['access_token'], token_data['refresh_token'], token_data['expires_at'])
-    
-    return token_data['access_token']
+    return response.json()
 
-def get_activities(user_id, page=1, per_page=50):
+def iter_activity_pages(user_id, max_pages=10, per_page=50, after=None, max_workers=None):
     """
-    Fetch activities from Strava API
+    Fetch activity pages concurrently and yield (page, activities) in page
+    order. The token is resolved once for all pages. Page 1 is requested
+    alone, so a sync with nothing (or less than a page) new costs one call;
+    later pages are fetched in parallel only once a full page came back,
+    and never past the first short or empty page. A failed page is yielded
+    with activities=None and ends the fetch; later pages that already
+    arrived are discarded, so callers never see a gap.
     """
     access_token = get_valid_token(user_id)
+    if not access_token:
+        yield 1, None
+        return
+    
+    max_workers = max_workers or FETCH_WORKERS
+    # Pages in flight at once; one until a full page shows there is more
+    in_flight = 1
+    last_page = max_pages
+    next_page = 1
+    next_to_yield = 1
+    pending = {}
+    # Pages that arrived before an earlier page did
+    arrived = {}
+    # Worker threads time their requests as part of this one
+    fetch = perf.propagate(get_activities)
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            while next_to_yield <= last_page:
+                while next_page <= last_page and len(pending) < in_flight:
+                    future = executor.submit(fetch, user_id, next_page, per_page, after, access_token)
+                    pending[future] = next_page
+                    next_page += 1
+                
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    page = pending.pop(future)
+                    try:
+                        activities = future.result()
+                    except requests.RequestException:
+                        activities = None
+                    arrived[page] = activities
+                    if activities is not None and len(activities) < per_page:
+                        last_page = min(last_page, page)
+                    elif activities is not None:
+                        in_flight = max_workers
+                
+                while next_to_yield <= last_page and next_to_yield in arrived:
+                    activities = arrived.pop(next_to_yield)
+                    yield next_to_yield, activities
+                    if activities is None:
+                        return
+                    next_to_yield += 1
+        finally:
+            # Pages past the last (or a failed) one are not needed
+            for future in pending:
+                future.cancel()
+
+def iter_activities(user_id, max_pages=10, per_page=50, after=None, status=None):
+    """
+    Yield activities one at a time, page by page in order, so only the
+    pages in flight are held in memory. If a status dict is given it is kept
+    updated with pages, fetched, failed and complete; complete is set only
+    once a short page arrives after every earlier page succeeded.
+    """
+    if status is None:
+        status = {}
+    status.update({"pages": 0, "fetched": 0, "failed": False, "complete": False})
+    
+    for page, activities in iter_activity_pages(user_id, max_pages=max_pages, per_page=per_page, after=after):
+        if activities is None:
+            # API error; the pages before it were all yielded and nothing after it is
+            status["failed"] = True
+            return
+        
+        status["pages"] += 1
+        status["fetched"] += len(activities)
+        if len(activities) < per_page:
+            # Pages arrive in order, so every earlier page has succeeded
+            status["complete"] = True
+        yield from activities
+
+def get_activity_streams(user_id, activity_id, keys=STREAM_KEYS, access_token=None):
+    """
+    Fetch the per-second streams of one activity.
+    Returns {channel: values} for the channels Strava has (empty for
+    activities without streams, e.g. manual entries), or None on failure.
+    """
+    if access_token is None:
+        access_token = get_valid_token(user_id)
     if not access_token:
         return None
     
     headers = {'Authorization': f'Bearer {access_token}'}
-    params = {'page': page, 'per_page': per_page}
+    params = {'keys': ",".join(keys), 'key_by_type': 'true'}
     
-    response = requests.get(ACTIVITIES_URL, headers=headers, params=params)
+    try:
+        response = strava_request("GET", STREAMS_URL.format(activity_id=activity_id), headers=headers, params=params)
+    except RateLimitExceeded:
+        return None
+    if response.status_code == 401:
+        invalidate_token(user_id)
+    if response.status_code == 404:
+        return {}
     if response.status_code != 200:
         return None
     
-    return response.json() 
\ No newline at end of file
+    # key_by_type returns {channel: {"data": [...], ...}}
+    return {channel: stream["data"] for channel, stream in response.json().items() if channel in keys}
+
+def iter_activity_streams(user_id, activity_ids, keys=STREAM_KEYS, max_workers=None):
+    """
+    Fetch streams for several activities concurrently and yield
+    (activity_id, streams) in completion order. Stops early (without
+    yielding the rest) if the token is missing or a request fails.
+    """
+    access_token = get_valid_token(user_id)
+    if not access_token:
+        return
+    
+    activity_ids = iter(activity_ids)
+    max_workers = max_workers or FETCH_WORKERS
+    pending = {}
+    failed = False
+    fetch = perf.propagate(get_activity_streams)
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            # Keep up to max_workers activities in flight
+            while not failed and len(pending) < max_workers:
+                activity_id = next(activity_ids, None)
+                if activity_id is None:
+                    break
+                future = executor.submit(fetch, user_id, activity_id, keys, access_token)
+                pending[future] = activity_id
+            if not pending:
+                return
+            
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                activity_id = pending.pop(future)
+                try:
+                    streams = future.result()
+                except requests.RequestException:
+                    streams = None
+                if streams is None:
+                    # Rate limit or API error; let in-flight requests finish
+                    failed = True
+                    continue
+                yield activity_id, streams
+
+def strip_activities(activities, fields=STRIPPED_FIELDS):
+    """
+    Yield copies of activities without the given (unused, bulky) fields
+    """
+    for activity in activities:
+        yield {key: value for key, value in activity.items() if key not in fields}
@@ -0,0 +1,155 @@
+import os
+import zlib
+import numpy as np
+from bson import Binary
+from gridfs import GridFSBucket
+from pymongo import UpdateOne
+from utils.db import get_database, get_sqlite_store
+
+# Storage dtype of each stream channel (little-endian so stored bytes are
+# portable). Strava sends seconds, metres, bpm, watts, rpm and metres.
+CHANNEL_DTYPES = {
+    "time": "<i4",
+    "distance": "<f4",
+    "heartrate": "<i2",
+    "watts": "<i2",
+    "cadence": "<i2",
+    "altitude": "<f4",
+}
+
+# zlib level used for stream payloads (1 = fastest, 9 = smallest)
+STREAM_COMPRESSION_LEVEL = int(os.getenv("STREAM_COMPRESSION_LEVEL", "6"))
+
+# Payloads larger than this many bytes go to GridFS instead of the document
+STREAM_INLINE_MAX = int(os.getenv("STREAM_INLINE_MAX", str(1024 * 1024)))
+
+# GridFS bucket holding large stream payloads
+GRIDFS_BUCKET = "activity_streams_fs"
+
+def encode_channel(channel, values):
+    """
+    Pack a channel's values into (dtype, length, codec, payload) where
+    payload is the typed array's bytes, zlib-compressed unless that does
+    not make it smaller
+    """
+    dtype = np.dtype(CHANNEL_DTYPES[channel])
+    array = np.asarray(values, dtype=np.float64)
+    if dtype.kind == "i":
+        # Strava reports dropouts as null; store them as 0
+        array = np.nan_to_num(array, nan=0.0)
+    raw = array.astype(dtype).tobytes()
+    compressed = zlib.compress(raw, STREAM_COMPRESSION_LEVEL)
+    if len(compressed) < len(raw):
+        return dtype.str, len(array), "zlib", compressed
+    return dtype.str, len(array), "raw", raw
+
+def decode_channel(doc, payload):
+    """
+    Turn a stored payload back into a read-only NumPy array. The array is a
+    view over the (decompressed) bytes, so no per-element copy is made.
+    """
+    if doc["codec"] == "zlib":
+        payload = zlib.decompress(payload)
+    return np.frombuffer(payload, dtype=np.dtype(doc["dtype"]), count=doc["length"])
+
+def save_streams(user_id, activity_id, streams):
+    """
+    Save an activity's streams ({channel: values}), one document per
+    channel. Activities without streams get an empty "time" channel so
+    they are not fetched again. Returns the number of channels saved.
+    """
+    streams = {channel: values for channel, values in streams.items() if channel in CHANNEL_DTYPES}
+    if not streams:
+        streams = {"time": []}
+
+    docs = []
+    for channel, values in streams.items():
+        dtype, length, codec, payload = encode_channel(channel, values)
+        docs.append({
+            "activity_id": activity_id,
+            "user_id": user_id,
+            "channel": channel,
+            "dtype": dtype,
+            "length": length,
+            "codec": codec,
+            "payload": payload,
+        })
+
+    db = get_database()
+    if db is None:
+        get_sqlite_store().save_stream_channels(docs)
+        return len(docs)
+
+    bucket = None
+    # Payloads of channels being replaced that live in GridFS
+    old_files = [
+        doc["gridfs_id"] for doc in db.activity_streams.find(
+            {"activity_id": activity_id, "channel": {"$in": list(streams)}}, {"gridfs_id": 1}
+        ) if "gridfs_id" in doc
+    ]
+
+    operations = []
+    for doc in docs:
+        payload = doc.pop("payload")
+        if len(payload) > STREAM_INLINE_MAX:
+            if bucket is None:
+                bucket = GridFSBucket(db, bucket_name=GRIDFS_BUCKET)
+            doc["gridfs_id"] = bucket.upload_from_stream(
+                f"{activity_id}/{doc['channel']}", payload,
+                metadata={"activity_id": activity_id, "channel": doc["channel"]}
+            )
+            unset = {"data": ""}
+        else:
+            doc["data"] = Binary(payload)
+            unset = {"gridfs_id": ""}
+        operations.append(UpdateOne(
+            {"activity_id": activity_id, "channel": doc["channel"]},
+            {"$set": doc, "$unset": unset},
+            upsert=True
+        ))
+    db.activity_streams.bulk_write(operations, ordered=False)
+
+    if old_files and bucket is None:
+        bucket = GridFSBucket(db, bucket_name=GRIDFS_BUCKET)
+    for file_id in old_files:
+        bucket.delete(file_id)
+    return len(docs)
+
+def get_streams(activity_id, channels=None):
+    """
+    Return an activity's streams as {channel: read-only NumPy array}.
+    channels limits which ones are read; missing channels are left out.
+    """
+    db = get_database()
+    if db is None:
+        return {
+            doc["channel"]: decode_channel(doc, doc["payload"])
+            for doc in get_sqlite_store().get_stream_channels(activity_id, channels)
+        }
+
+    query = {"activity_id": activity_id}
+    if channels is not None:
+        query["channel"] = {"$in": list(channels)}
+
+    bucket = None
+    streams = {}
+    for doc in db.activity_streams.find(query, {"_id": 0}):
+        if "gridfs_id" in doc:
+            if bucket is None:
+                bucket = GridFSBucket(db, bucket_name=GRIDFS_BUCKET)
+            payload = bucket.open_download_stream(doc["gridfs_id"]).read()
+        else:
+            # bson.Binary is a bytes subclass; frombuffer views it in place
+            payload = doc["data"]
+        streams[doc["channel"]] = decode_channel(doc, payload)
+    return streams
+
+def stream_activity_ids(user_id):
+    """
+    Return the ids of the user's activities that already have streams stored
+    """
+    db = get_database()
+    if db is None:
+        return get_sqlite_store().stream_activity_ids(user_id)
+
+    return set(db.activity_streams.distinct("activity_id", {"user_id": user_id}))
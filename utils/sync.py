@@ -0,0 +1,140 @@
+import calendar
+import time
+from utils.db import (
+    bump_data_version,
+    clear_sync_watermark,
+    get_sync_watermark,
+    get_user_activities,
+    save_activity_stream,
+    update_sync_watermark
+)
+from utils.efforts import save_activity_curves
+from utils.snapshot import append_snapshot, has_snapshot, write_snapshot
+from utils.strava import get_rate_limit_status, iter_activities, iter_activity_streams, strip_activities
+from utils.streams import get_streams, save_streams, stream_activity_ids
+from utils.visualization import ACTIVITY_FIELDS
+
+# Strava's default and maximum page sizes
+PER_PAGE = 50
+
+# Activities whose streams are fetched per stream sync (one request each)
+STREAMS_PER_SYNC = 50
+
+def start_date_to_epoch(start_date):
+    """
+    Convert a Strava start_date string (UTC, ISO 8601) to an epoch timestamp
+    """
+    return calendar.timegm(time.strptime(start_date, "%Y-%m-%dT%H:%M:%SZ"))
+
+def sync_activities(user_id, full=False, max_pages=10, per_page=PER_PAGE, on_page=None):
+    """
+    Fetch a user's activities from Strava and save them.
+
+    Incremental syncs only request activities after the stored watermark
+    (the latest start_date already saved) and stop at the first short page.
+    A full resync clears the watermark and re-fetches pages 1..max_pages.
+    Activities stream from the concurrent page fetcher through a transform
+    that strips unused fields into fixed-size write batches, so memory stays
+    flat however long the history. on_page(pages_done, max_pages, fetched)
+    is called as each page starts streaming. The local columnar snapshot
+    used by offline mode is appended per batch (or rebuilt at the end).
+
+    The result holds the write counts plus pages, fetched, watermark and:
+    complete (a short page showed nothing is left), failed (a page request
+    failed) and budget_exhausted (nothing was requested because today's
+    Strava budget is used up). Neither complete nor failed means the sync
+    stopped at max_pages with more pages left.
+    """
+    if full:
+        clear_sync_watermark(user_id)
+        after = None
+    else:
+        watermark = get_sync_watermark(user_id)
+        after = start_date_to_epoch(watermark) if watermark else None
+    
+    # Never plan more pages than today's remaining Strava budget
+    max_pages = min(max_pages, get_rate_limit_status()["daily_remaining"])
+    if max_pages <= 0:
+        return {
+            "inserted": 0, "modified": 0, "unchanged": 0, "pages": 0, "fetched": 0, "watermark": None,
+            "complete": False, "failed": False, "budget_exhausted": True,
+        }
+    
+    # Without a snapshot (or on a full resync) it is rebuilt from the
+    # database afterwards; otherwise new and edited activities are appended
+    # per batch
+    rebuild_snapshot = full or not has_snapshot(user_id)
+    
+    status = {}
+    result = {"watermark": None, "budget_exhausted": False}
+    
+    def track(activities):
+        # Report progress and advance the watermark as activities stream past
+        pages_reported = 0
+        for activity in activities:
+            if on_page and status["pages"] != pages_reported:
+                pages_reported = status["pages"]
+                on_page(pages_reported, max_pages, status["fetched"])
+            if not result["watermark"] or activity["start_date"] > result["watermark"]:
+                result["watermark"] = activity["start_date"]
+            yield activity
+    
+    def save_snapshot_batch(batch, counts):
+        # Unchanged batches (re-fetched pages) would only add duplicate copies
+        if not rebuild_snapshot and (counts["inserted"] or counts["modified"]):
+            append_snapshot(user_id, batch)
+    
+    stream = iter_activities(user_id, max_pages=max_pages, per_page=per_page, after=after, status=status)
+    stream = strip_activities(track(stream))
+    counts = save_activity_stream(user_id, stream, on_batch=save_snapshot_batch)
+    
+    result.update(counts)
+    result.update({key: status[key] for key in ("pages", "fetched", "complete", "failed")})
+    if on_page:
+        on_page(status["pages"], max_pages, status["fetched"])
+    
+    if result["watermark"]:
+        update_sync_watermark(user_id, result["watermark"])
+    
+    if rebuild_snapshot:
+        write_snapshot(user_id, get_user_activities(user_id, fields=ACTIVITY_FIELDS))
+    if rebuild_snapshot or result["fetched"]:
+        # Cached frames may have been built from the old snapshot
+        bump_data_version(user_id)
+    
+    return result
+
+def sync_streams(user_id, limit=STREAMS_PER_SYNC, on_activity=None):
+    """
+    Fetch and store per-second streams for the user's stored activities
+    that do not have them yet, newest first, at most `limit` activities
+    (capped by today's remaining Strava budget). Each activity's
+    mean-maximal curves and best efforts are computed as it is saved.
+    on_activity(done, total) is called after each activity.
+    """
+    have_streams = stream_activity_ids(user_id)
+    activities = get_user_activities(user_id, fields=["id", "sport_type", "start_date"])
+    activities.sort(key=lambda activity: activity.get("start_date", ""), reverse=True)
+    missing = {activity["id"]: activity for activity in activities if activity["id"] not in have_streams}
+    
+    limit = min(limit, get_rate_limit_status()["daily_remaining"])
+    todo = list(missing)[:limit]
+    
+    saved = 0
+    for activity_id, streams in iter_activity_streams(user_id, todo):
+        save_streams(user_id, activity_id, streams)
+        # Read back the typed arrays (nulls cleaned) for the curves
+        save_activity_curves(user_id, missing[activity_id], get_streams(activity_id))
+        saved += 1
+        if on_activity:
+            on_activity(saved, len(todo))
+    
+    if saved:
+        # Cached all-time curves are now out of date
+        bump_data_version(user_id)
+    
+    return {
+        "saved": saved,
+        "remaining": len(missing) - saved,
+        "complete": saved == len(missing),
+    }
@@ -0,0 +1,196 @@
+import os
+from datetime import date, datetime, timedelta
+import numpy as np
+import pandas as pd
+from pymongo import UpdateOne
+from utils import perf
+from utils.db import (
+    ACTIVITY_BATCH_SIZE,
+    clear_training_load_stale,
+    get_database,
+    get_sqlite_store,
+    get_training_load_stale_from,
+    get_user_activities
+)
+from utils.visualization import ACTIVITY_FIELDS, prepare_activity_data
+
+# Time constants (days) of fitness (CTL) and fatigue (ATL)
+CTL_DAYS = 42
+ATL_DAYS = 7
+
+# Thresholds used to turn an activity into a load (100 = one hour at threshold).
+# Power is used when FTP_WATTS is set and the activity has power, else heart
+# rate, else DEFAULT_INTENSITY for the whole moving time.
+FTP_WATTS = float(os.getenv("FTP_WATTS", "0")) or None
+THRESHOLD_HR = float(os.getenv("THRESHOLD_HR", "170"))
+RESTING_HR = float(os.getenv("RESTING_HR", "60"))
+DEFAULT_INTENSITY = 0.75
+
+# Days per vectorized block of the EWMA recurrence; keeps a**-BLOCK finite
+EWMA_BLOCK = 128
+
+def activity_loads(df):
+    """
+    Load of each activity in a prepared activity frame:
+    moving hours * intensity^2 * 100
+    """
+    hours = df["moving_time_min"].to_numpy(dtype=np.float64, na_value=0.0) / 60
+    intensity = np.full(len(df), DEFAULT_INTENSITY)
+    if "average_heartrate" in df.columns:
+        heartrate = df["average_heartrate"].to_numpy(dtype=np.float64, na_value=np.nan)
+        hr_intensity = (heartrate - RESTING_HR) / (THRESHOLD_HR - RESTING_HR)
+        intensity = np.where(np.isnan(hr_intensity), intensity, hr_intensity)
+    if FTP_WATTS and "average_watts" in df.columns:
+        watts = df["average_watts"].to_numpy(dtype=np.float64, na_value=np.nan)
+        intensity = np.where(np.isnan(watts), intensity, watts / FTP_WATTS)
+    intensity = np.clip(intensity, 0.0, 1.5)
+    return hours * intensity ** 2 * 100
+
+def daily_loads(df, first_day, last_day):
+    """
+    Sum activity loads per UTC day from first_day to last_day (inclusive).
+    Returns (days as datetime64[D], loads).
+    """
+    first = np.datetime64(first_day, 'D')
+    n_days = int((np.datetime64(last_day, 'D') - first).astype(np.int64)) + 1
+    days = first + np.arange(n_days)
+    if df.empty:
+        return days, np.zeros(n_days)
+
+    day_index = (df["start_date"].dt.tz_localize(None).to_numpy().astype('datetime64[D]') - first).astype(np.int64)
+    in_range = (day_index >= 0) & (day_index < n_days)
+    loads = np.bincount(day_index[in_range], weights=activity_loads(df)[in_range], minlength=n_days)
+    return days, loads
+
+def ewma(loads, time_constant, initial=0.0):
+    """
+    Run y[t] = y[t-1] + (loads[t] - y[t-1]) / time_constant from y[-1] =
+    initial. Within each block of EWMA_BLOCK days the recurrence is solved
+    in closed form with a cumulative sum, so there is no per-day Python loop.
+    """
+    decay = 1.0 - 1.0 / time_constant
+    powers = decay ** np.arange(1, EWMA_BLOCK + 1)
+    out = np.empty(len(loads))
+    previous = initial
+    for start in range(0, len(loads), EWMA_BLOCK):
+        block = loads[start:start + EWMA_BLOCK]
+        p = powers[:len(block)]
+        # y[t] = decay^(t+1) * previous + (1 - decay) * sum_k decay^(t-k) * loads[k]
+        values = p * previous + (1.0 - decay) * p * np.cumsum(block / p)
+        out[start:start + len(block)] = values
+        previous = values[-1]
+    return out
+
+def _state_before(user_id, day):
+    """
+    Return (ctl, atl) persisted for the day before `day`, or (0, 0)
+    """
+    previous = (date.fromisoformat(day) - timedelta(days=1)).isoformat()
+    db = get_database()
+    if db is None:
+        docs = get_sqlite_store().get_training_load(user_id, previous, previous)
+        doc = docs[0] if docs else None
+    else:
+        doc = db.training_load.find_one({"user_id": user_id, "date": previous})
+    if not doc:
+        return 0.0, 0.0
+    return doc["ctl"], doc["atl"]
+
+def _last_day(user_id):
+    """
+    Return the latest day with persisted state, or None
+    """
+    db = get_database()
+    if db is None:
+        return get_sqlite_store().last_training_load_day(user_id)
+    doc = db.training_load.find_one({"user_id": user_id}, {"date": 1}, sort=[("date", -1)])
+    return doc["date"] if doc else None
+
+def _save_days(user_id, docs):
+    db = get_database()
+    if db is None:
+        get_sqlite_store().save_training_load(docs)
+        return
+
+    for i in range(0, len(docs), ACTIVITY_BATCH_SIZE):
+        db.training_load.bulk_write([
+            UpdateOne({"user_id": user_id, "date": doc["date"]}, {"$set": doc}, upsert=True)
+            for doc in docs[i:i + ACTIVITY_BATCH_SIZE]
+        ], ordered=False)
+
+@perf.timed("training_load")
+def update_training_load(user_id, today=None):
+    """
+    Bring the user's persisted daily training load up to date through
+    `today` (UTC). Only days from the earliest changed activity day (or
+    the day after the last persisted one) forward are recomputed, seeded
+    from the stored state of the day before. Returns the first recomputed
+    day, or None if nothing had to change.
+    """
+    today = (today or datetime.utcnow().date()).isoformat()
+    stale_from = get_training_load_stale_from(user_id)
+    last_day = _last_day(user_id)
+
+    if last_day is None:
+        start = None
+    elif stale_from and stale_from <= last_day:
+        start = stale_from
+    elif last_day < today:
+        # No new activities; only carry the decay forward to today
+        start = (date.fromisoformat(last_day) + timedelta(days=1)).isoformat()
+    else:
+        return None
+
+    activities = get_user_activities(user_id, fields=ACTIVITY_FIELDS, start_date=start)
+    df = prepare_activity_data(activities)
+    if start is None:
+        if df.empty:
+            return None
+        start = df["start_date"].min().date().isoformat()
+    if start > today:
+        return None
+
+    days, loads = daily_loads(df, start, today)
+    ctl_seed, atl_seed = _state_before(user_id, start)
+    ctl = ewma(loads, CTL_DAYS, ctl_seed)
+    atl = ewma(loads, ATL_DAYS, atl_seed)
+    # Form is yesterday's fitness minus yesterday's fatigue
+    tsb = np.concatenate(([ctl_seed - atl_seed], (ctl - atl)[:-1]))
+
+    _save_days(user_id, [
+        {
+            "user_id": user_id,
+            "date": str(day),
+            "load": float(load),
+            "ctl": float(c),
+            "atl": float(a),
+            "tsb": float(t),
+        }
+        for day, load, c, a, t in zip(days, loads, ctl, atl, tsb)
+    ])
+    if stale_from:
+        clear_training_load_stale(user_id, stale_from)
+    return start
+
+def get_training_load(user_id, start_date=None, today=None):
+    """
+    Return the user's daily load, CTL (fitness), ATL (fatigue) and TSB
+    (form) as a DataFrame indexed by day, updating the stored state first
+    """
+    update_training_load(user_id, today=today)
+    start = start_date.isoformat() if hasattr(start_date, "isoformat") else start_date
+
+    db = get_database()
+    if db is None:
+        docs = get_sqlite_store().get_training_load(user_id, start)
+    else:
+        query = {"user_id": user_id}
+        if start:
+            query["date"] = {"$gte": start}
+        docs = list(db.training_load.find(query, {"_id": 0, "user_id": 0}).sort("date", 1))
+
+    if not docs:
+        return pd.DataFrame(columns=["load", "ctl", "atl", "tsb"])
+    df = pd.DataFrame(docs)
+    df["date"] = pd.to_datetime(df["date"])
+    return df.set_index("date")[["load", "ctl", "atl", "tsb"]]
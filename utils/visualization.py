@@ -1,108 +1,285 @@
+import numpy as np
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
-from datetime import datetime, timedelta
+from utils import perf
+from utils.rollups import CHART_POINT_BUDGET, lttb
 
-def prepare_activity_data(activities):
+# Compact dtypes for the activity fields prepare_activity_data keeps; every
+# other field (map, athlete, segment data, _id, ...) is dropped
+ACTIVITY_SCHEMA = {
+    "id": "int64",
+    "type": "category",
+    "sport_type": "category",
+    "start_date": "datetime64[ns, UTC]",
+    "distance": "float32",
+    "moving_time": "float32",
+    "elapsed_time": "float32",
+    "average_heartrate": "float32",
+    "average_watts": "float32",
+}
+
+# Activity fields read by prepare_activity_data; pass to get_user_activities
+# so only these are fetched from the database
+ACTIVITY_FIELDS = list(ACTIVITY_SCHEMA)
+
+def _raw_memory_usage(activities):
     """
-    Convert activities data to a DataFrame and prepare for visualization
+    Memory a plain pd.DataFrame(activities) would use, in bytes
     """
-    if not activities or len(activities) == 0:
-        return pd.DataFrame()
-    
-    # Convert to DataFrame
-    df = pd.DataFrame(activities)
-    
-    # Convert timestamp strings to datetime objects
+    return int(pd.DataFrame(activities).memory_usage(deep=True).sum())
+
+def activity_frame(activities):
+    """
+    Build a DataFrame holding only the ACTIVITY_SCHEMA columns of activity
+    documents. Columns are built straight from the documents so nested
+    fields never become object columns.
+    """
+    columns = {}
+    for field, dtype in ACTIVITY_SCHEMA.items():
+        values = [activity.get(field) for activity in activities]
+        if all(value is None for value in values):
+            continue
+        if field == "start_date":
+            columns[field] = pd.to_datetime(values, utc=True)
+        elif dtype == "int64":
+            columns[field] = pd.array(values, dtype="Int64")
+        else:
+            columns[field] = pd.Series(values, dtype=dtype)
+    return pd.DataFrame(columns)
+
+def prepare_activity_frame(df):
+    """
+    Add the derived calendar and unit columns to a frame of ACTIVITY_SCHEMA columns
+    """
+    # Derive calendar columns from the datetimes
     if 'start_date' in df.columns:
-        df['start_date'] = pd.to_datetime(df['start_date'])
-        df['date'] = df['start_date'].dt.date
-        df['month'] = df['start_date'].dt.month
-        df['year'] = df['start_date'].dt.year
-        df['day_of_week'] = df['start_date'].dt.dayofweek
-        df['week'] = df['start_date'].dt.isocalendar().week
-        df['week_year'] = df['start_date'].dt.isocalendar().year
-        # Create a week identifier (year + week)
-        df['week_id'] = df['week_year'].astype(str) + '-' + df['week'].astype(str).str.zfill(2)
+        df['date'] = df['start_date'].dt.normalize()
+        df['month'] = df['start_date'].dt.month.astype('int16')
+        df['year'] = df['start_date'].dt.year.astype('int16')
+        df['day_of_week'] = df['start_date'].dt.dayofweek.astype('int16')
+        iso = df['start_date'].dt.isocalendar()
+        df['week'] = iso['week'].astype('int16')
+        df['week_year'] = iso['year'].astype('int16')
+        # Numeric week identifier (year * 100 + week, e.g. 202401)
+        df['week_id'] = df['week_year'].astype('int32') * 100 + df['week']
     
     # Convert distances from meters to kilometers
     if 'distance' in df.columns:
-        df['distance_km'] = df['distance'] / 1000
+        df['distance_km'] = df['distance'] / np.float32(1000)
     
     # Convert moving_time and elapsed_time from seconds to minutes
     if 'moving_time' in df.columns:
-        df['moving_time_min'] = df['moving_time'] / 60
+        df['moving_time_min'] = df['moving_time'] / np.float32(60)
     
     if 'elapsed_time' in df.columns:
-        df['elapsed_time_min'] = df['elapsed_time'] / 60
+        df['elapsed_time_min'] = df['elapsed_time'] / np.float32(60)
         
     # Calculate velocity (km/h) if we have both distance and time
     if 'distance' in df.columns and 'moving_time' in df.columns:
         # Convert to km/h: (meters/1000) / (seconds/3600)
-        df['velocity_kmh'] = (df['distance'] / 1000) / (df['moving_time'] / 3600)
+        df['velocity_kmh'] = df['distance'] * np.float32(3.6) / df['moving_time']
     
     return df
 
-def create_weekly_volume_chart(df):
+@perf.timed("prepare_activity_data")
+def prepare_activity_data(activities, report_memory=False):
     """
-    Create a line chart showing weekly volume (total distance) over time
+    Convert activities data to a compact DataFrame and prepare for visualization.
+    Only the fields in ACTIVITY_SCHEMA are kept, with small dtypes; with
+    report_memory, df.attrs["memory"] holds the bytes used before and after.
     """
-    if df.empty or 'distance_km' not in df.columns or 'week_id' not in df.columns:
-        return go.Figure()
+    if not activities or len(activities) == 0:
+        return pd.DataFrame()
     
-    # Group by week and sum distances
-    weekly_volume = df.groupby(['week_year', 'week', 'week_id'])['distance_km'].sum().reset_index()
+    df = prepare_activity_frame(activity_frame(activities))
     
-    # Create a proper date for each week (using the first day of each week)
-    weekly_volume['week_date'] = weekly_volume.apply(
-        lambda x: datetime.strptime(f"{int(x['week_year'])}-{int(x['week'])}-1", "%Y-%W-%w"), axis=1
-    )
-    weekly_volume = weekly_volume.sort_values('week_date')
+    if report_memory:
+        df.attrs["memory"] = {
+            "raw_bytes": _raw_memory_usage(activities),
+            "compact_bytes": int(df.memory_usage(deep=True).sum()),
+        }
     
-    fig = px.line(
-        weekly_volume,
-        x='week_date',
-        y='distance_km',
-        title='Weekly Volume Over Time',
-        labels={
-            'week_date': 'Week',
-            'distance_km': 'Total Distance (km)'
+    return df
+
+def summarize_weekly(weekly):
+    """
+    Compute the dashboard's summary statistics from a rollup frame (any resolution)
+    """
+    if weekly.empty:
+        return {
+            "total_activities": 0,
+            "total_distance_km": 0.0,
+            "total_time_h": 0.0,
+            "avg_velocity_kmh": None,
         }
-    )
     
-    # Add markers
-    fig.update_traces(mode='lines+markers')
+    velocity_count = weekly['velocity_count'].sum()
+    avg_velocity = None
+    if velocity_count > 0:
+        avg_velocity = (weekly['velocity_kmh'].fillna(0) * weekly['velocity_count']).sum() / velocity_count
     
-    return fig
+    return {
+        "total_activities": int(weekly['activity_count'].sum()),
+        "total_distance_km": float(weekly['distance_km'].sum()),
+        "total_time_h": float(weekly['moving_time_min'].sum() / 60),
+        "avg_velocity_kmh": avg_velocity,
+    }
+
+# Chart title prefix and x-axis label per rollup resolution
+RESOLUTION_NAMES = {"day": ("Daily", "Day"), "week": ("Weekly", "Week"), "month": ("Monthly", "Month")}
 
-def create_weekly_velocity_chart(df):
+def _downsampled_trace(rollup, column, budget=None):
     """
-    Create a line chart showing average weekly velocity over time
+    Build a WebGL line trace of one rollup column, downsampled with LTTB
+    when it has more points than the chart point budget
     """
-    if df.empty or 'velocity_kmh' not in df.columns or 'week_id' not in df.columns:
+    budget = budget or CHART_POINT_BUDGET
+    series = rollup[['period_date', column]].dropna()
+    x = series['period_date'].to_numpy()
+    y = series[column].to_numpy(dtype=np.float64)
+    if len(x) > budget:
+        idx = lttb(x.astype('datetime64[ns]').astype(np.int64), y, budget)
+        x, y = x[idx], y[idx]
+    return go.Scattergl(
+        x=x,
+        y=y,
+        mode='lines+markers' if len(x) <= 200 else 'lines',
+        hovertemplate='%{x|%Y-%m-%d}: %{y:.1f}<extra></extra>',
+    )
+
+@perf.timed("plotly.figure")
+def create_volume_chart(rollup, resolution, budget=None):
+    """
+    Create a line chart of total distance per period from a rollup frame
+    """
+    if rollup.empty or 'distance_km' not in rollup.columns:
         return go.Figure()
     
-    # Group by week and calculate average velocity
-    weekly_velocity = df.groupby(['week_year', 'week', 'week_id'])['velocity_kmh'].mean().reset_index()
-    
-    # Create a proper date for each week (using the first day of each week)
-    weekly_velocity['week_date'] = weekly_velocity.apply(
-        lambda x: datetime.strptime(f"{int(x['week_year'])}-{int(x['week'])}-1", "%Y-%W-%w"), axis=1
+    name, period = RESOLUTION_NAMES[resolution]
+    fig = go.Figure(_downsampled_trace(rollup, 'distance_km', budget))
+    fig.update_layout(
+        title=f'{name} Volume Over Time',
+        xaxis_title=period,
+        yaxis_title='Total Distance (km)',
     )
-    weekly_velocity = weekly_velocity.sort_values('week_date')
+    return fig
+
+@perf.timed("plotly.figure")
+def create_velocity_chart(rollup, resolution, budget=None):
+    """
+    Create a line chart of average velocity per period from a rollup frame
+    """
+    if rollup.empty or 'velocity_kmh' not in rollup.columns:
+        return go.Figure()
     
-    fig = px.line(
-        weekly_velocity,
-        x='week_date',
-        y='velocity_kmh',
-        title='Average Weekly Velocity Over Time',
-        labels={
-            'week_date': 'Week',
-            'velocity_kmh': 'Average Velocity (km/h)'
-        }
+    name, period = RESOLUTION_NAMES[resolution]
+    fig = go.Figure(_downsampled_trace(rollup, 'velocity_kmh', budget))
+    fig.update_layout(
+        title=f'Average {name} Velocity Over Time',
+        xaxis_title=period,
+        yaxis_title='Average Velocity (km/h)',
     )
+    return fig
+
+@perf.timed("plotly.figure")
+def create_training_load_chart(load):
+    """
+    Create a chart of fitness (CTL), fatigue (ATL) and form (TSB) from the
+    daily training load frame
+    """
+    if load.empty:
+        return go.Figure()
     
-    # Add markers
-    fig.update_traces(mode='lines+markers')
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=load.index, y=load['ctl'], name='Fitness (CTL)', line={'color': '#1f77b4'}))
+    fig.add_trace(go.Scatter(x=load.index, y=load['atl'], name='Fatigue (ATL)', line={'color': '#d62728'}))
+    fig.add_trace(go.Bar(x=load.index, y=load['tsb'], name='Form (TSB)', marker_color='#7f7f7f', opacity=0.5))
+    fig.update_layout(
+        title='Fitness, Fatigue and Form',
+        xaxis_title='Date',
+        yaxis_title='Training Load',
+        hovermode='x unified',
+    )
+    return fig
+
+@perf.timed("plotly.figure")
+def create_cohort_chart(cohort, user_weekly=None, user_label=None):
+    """
+    Create a chart of the cohort's average and best weekly distance,
+    optionally with one athlete's weekly distance on top
+    """
+    if cohort.empty:
+        return go.Figure()
+
+    fig = go.Figure()
+    fig.add_trace(go.Scattergl(x=cohort['period_date'], y=cohort['avg_distance_km'], name='Cohort average', mode='lines'))
+    fig.add_trace(go.Scattergl(x=cohort['period_date'], y=cohort['max_distance_km'], name='Cohort best', mode='lines',
+                               line={'dash': 'dot'}))
+    if user_weekly is not None and not user_weekly.empty:
+        fig.add_trace(go.Scattergl(x=user_weekly['period_date'], y=user_weekly['distance_km'],
+                                   name=user_label or 'Athlete', mode='lines+markers'))
+    fig.update_layout(
+        title='Weekly Distance vs Cohort',
+        xaxis_title='Week',
+        yaxis_title='Distance (km)',
+        hovermode='x unified',
+    )
+    return fig
+
+# Axis labels of the mean-maximal curve channels
+CURVE_LABELS = {
+    "watts": "Power (W)",
+    "heartrate": "Heart Rate (bpm)",
+    "speed": "Speed (km/h)",
+}
+
+def _format_duration(seconds):
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+@perf.timed("plotly.figure")
+def create_mean_max_chart(curves, channel):
+    """
+    Create a log-scale line chart of an all-time mean-maximal curve
+    (from all_time_curves)
+    """
+    values = np.asarray(curves["curves"][channel], dtype=float)
+    if np.isnan(values).all():
+        return go.Figure()
     
-    return fig 
\ No newline at end of file
+    durations = np.asarray(curves["durations"])
+    valid = ~np.isnan(values)
+    fig = go.Figure(go.Scatter(
+        x=durations[valid],
+        y=values[valid],
+        mode='lines+markers',
+        text=[_format_duration(d) for d in durations[valid]],
+        customdata=[curves["curve_activities"][channel][i] for i in np.flatnonzero(valid)],
+        hovertemplate='%{text}: %{y:.1f}<br>Activity %{customdata}<extra></extra>',
+    ))
+    fig.update_layout(
+        title=f'Mean-Maximal Curve: {CURVE_LABELS[channel]}',
+        xaxis_title='Duration',
+        yaxis_title=CURVE_LABELS[channel],
+    )
+    fig.update_xaxes(
+        type='log',
+        tickvals=durations,
+        ticktext=[_format_duration(d) for d in durations],
+    )
+    return fig
+
+def best_efforts_table(curves):
+    """
+    Format all-time best efforts (from all_time_curves) as a DataFrame
+    """
+    rows = []
+    for name, seconds, activity_id in zip(curves["distances"], curves["best_efforts"], curves["effort_activities"]):
+        if activity_id is None:
+            continue
+        rows.append({"Distance": name, "Time": _format_duration(seconds), "Activity": activity_id})
+    return pd.DataFrame(rows)
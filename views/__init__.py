@@ -0,0 +1,11 @@
+"""
+Dashboard pages. app.py imports each module the first time its page is
+opened, so a cold start only loads the page being shown.
+"""
+
+# Visualization time ranges (days back from today, None for all time)
+TIME_RANGES = {
+    "All time": None,
+    "Last 12 months": 365,
+    "Last 3 months": 90,
+}
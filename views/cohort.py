@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+import streamlit as st
+from utils.cohort import cohort_weekly, user_weekly_distance, weekly_leaderboard
+from utils.db import get_all_user_ids
+from utils.visualization import create_cohort_chart
+from views import TIME_RANGES
+
+def render():
+    """
+    Cohort page: compare the stored athletes (offline mode)
+    """
+    st.title("Cohort Comparison")
+    
+    if not st.session_state.offline_mode:
+        st.warning("Enable offline mode to compare the athletes stored in the database.")
+    else:
+        all_user_ids = get_all_user_ids()
+        cohort_users = st.multiselect("Athletes", all_user_ids, default=all_user_ids)
+        time_range = st.selectbox("Time range", list(TIME_RANGES.keys()))
+        days = TIME_RANGES[time_range]
+        start_date = datetime.utcnow().date() - timedelta(days=days) if days else None
+        
+        # Read from the weekly_summaries collection: one small row per athlete and week
+        cohort = cohort_weekly(cohort_users, start_date=start_date)
+        if cohort.empty:
+            st.warning("No activities found for the selected athletes.")
+        else:
+            user_weekly = None
+            if st.session_state.user_id in cohort_users:
+                user_weekly = user_weekly_distance(st.session_state.user_id, start_date=start_date)
+            st.plotly_chart(
+                create_cohort_chart(cohort, user_weekly, user_label=f"User {st.session_state.user_id}"),
+                use_container_width=True
+            )
+            
+            st.subheader("Weekly Leaderboard")
+            weeks = cohort.loc[cohort["active_users"] > 0, "period_date"].dt.date.tolist()[::-1]
+            week = st.selectbox("Week starting", weeks)
+            leaderboard = weekly_leaderboard(cohort_users, week)
+            col1, col2 = st.columns(2)
+            col1.metric("Active athletes", len(leaderboard))
+            row = leaderboard[leaderboard["user_id"] == st.session_state.user_id]
+            if not row.empty:
+                col2.metric("Your rank", f"{int(row['rank'].iloc[0])} / {len(leaderboard)}")
+            st.dataframe(leaderboard.round(2), use_container_width=True, hide_index=True)
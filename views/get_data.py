@@ -0,0 +1,88 @@
+import streamlit as st
+from utils.db import count_user_activities
+from utils.strava import get_rate_limit_status
+from utils.sync import STREAMS_PER_SYNC, sync_activities, sync_streams
+
+def render():
+    """
+    Get Data page: fetch activities and streams from Strava
+    """
+    st.title("Get Data from Strava")
+    
+    if st.session_state.offline_mode:
+        st.info("You are in offline mode. Switch to online mode to fetch new data from Strava.")
+        
+        # Offline mode reads the local snapshot, so count what it holds
+        if st.session_state.user_id:
+            from utils.snapshot import read_snapshot
+            snapshot = read_snapshot(st.session_state.user_id, ["id"])
+            activities_count = 0 if snapshot is None else len(snapshot)
+            if activities_count > 0:
+                st.success(f"{activities_count} activities found in the local snapshot for the selected user.")
+            else:
+                st.warning("No activities found in the local snapshot for the selected user.")
+    elif not st.session_state.authenticated:
+        st.warning("You need to connect your Strava account first. Go to the Home page.")
+    else:
+        st.write("Fetch your activities from Strava and save them to the database.")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            # Option to set how many pages of activities to fetch
+            max_pages = st.number_input("Maximum pages to fetch (50 activities per page)", 
+                                        min_value=1, max_value=10, value=2)
+            # Incremental syncs only fetch activities newer than the last sync
+            full_resync = st.checkbox("Full resync", value=False,
+                                      help="Re-download pages from the most recent activity instead of only new ones")
+        
+        with col2:
+            # Fetch activities button
+            if st.button("Fetch Activities"):
+                progress_bar = st.progress(0)
+                status_text = st.empty()
+                status_text.text("Fetching activities...")
+                
+                def show_progress(pages_done, max_pages, fetched):
+                    progress_bar.progress(pages_done / max_pages if max_pages else 1.0)
+                    status_text.text(f"Fetched {pages_done} of up to {max_pages} pages ({fetched} activities)...")
+                
+                result = sync_activities(
+                    st.session_state.user_id,
+                    full=full_resync,
+                    max_pages=max_pages,
+                    on_page=show_progress
+                )
+                
+                progress_bar.progress(1.0)
+                status_text.text(f"Completed: Saved {result['fetched']} activities to the database ({result['inserted']} new).")
+                st.session_state.activities_loaded = True
+                if result["budget_exhausted"]:
+                    st.warning("Today's Strava API budget is used up. Try again after midnight UTC.")
+                elif result["failed"]:
+                    st.warning("Stopped before all activities were fetched (Strava API error or rate limit). Try again later.")
+                elif not result["complete"]:
+                    st.info("Reached the page limit before the last page; more activities remain on Strava.")
+            
+            # Per-second streams cost one request per activity, so fetch them in chunks
+            if st.button("Fetch Activity Streams", help=f"Download per-second data for up to {STREAMS_PER_SYNC} activities"):
+                streams_bar = st.progress(0)
+                
+                def show_streams_progress(done, total):
+                    streams_bar.progress(done / total)
+                
+                result = sync_streams(st.session_state.user_id, on_activity=show_streams_progress)
+                streams_bar.progress(1.0)
+                st.write(f"Saved streams for {result['saved']} activities; {result['remaining']} still without streams.")
+            
+            quota = get_rate_limit_status()
+            st.caption(
+                f"Strava API budget: {quota['short_remaining']}/{quota['short_limit']} requests left "
+                f"in this 15-minute window, {quota['daily_remaining']}/{quota['daily_limit']} today."
+            )
+
+        # Check if any activities are in the database
+        activities_count = count_user_activities(st.session_state.user_id)
+        if activities_count > 0:
+            st.success(f"{activities_count} activities found in the database.")
+        else:
+            st.info("No activities found in the database. Click 'Fetch Activities' to get your data.")
@@ -0,0 +1,37 @@
+import streamlit as st
+
+def render():
+    """
+    Home page: connect to Strava or disconnect
+    """
+    st.title("Strava Activity Dashboard")
+    st.write("This app allows you to retrieve your Strava activities and visualize them.")
+    
+    if st.session_state.offline_mode:
+        st.info("You are in offline mode. You can view your previously saved data.")
+        st.write("Use the sidebar to navigate to Visualizations.")
+    elif not st.session_state.authenticated:
+        st.write("To get started, connect your Strava account:")
+        
+        # Generate a redirect URL to this app
+        redirect_uri = st.secrets.get("REDIRECT_URI", "http://localhost:8501")
+        # For Streamlit Cloud, make sure we're using https
+        if redirect_uri.startswith("stravagetdatav2.streamlit.app"):
+            redirect_uri = "https://" + redirect_uri
+        
+        st.write(f"Redirect URI: {redirect_uri}")  # Debug info - can remove later
+        # Imported here so signed-in visits never load the HTTP client
+        from utils.strava import get_auth_url
+        auth_url = get_auth_url(redirect_uri)
+        
+        st.markdown(f"<a href='{auth_url}' target='_self'><button style='background-color:#FC4C02; color:white; padding:10px; border-radius:5px; border:none;'>Connect with Strava</button></a>", unsafe_allow_html=True)
+        st.markdown("**Note:** If you encounter any issues with the redirect, please sign in directly to Strava first in another tab, then return here and click the connect button.", unsafe_allow_html=True)
+    else:
+        st.write("You are connected to Strava! Use the sidebar to navigate.")
+        
+        # Show a button to disconnect if needed
+        if st.button("Disconnect from Strava"):
+            st.session_state.user_id = None
+            st.session_state.authenticated = False
+            st.session_state.activities_loaded = False
+            st.rerun()
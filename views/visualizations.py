@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta
+import streamlit as st
+from utils.cache import get_curves, get_rollup_data, get_training_load_data
+from utils.db import DatabaseUnavailable
+from utils.visualization import (
+    CURVE_LABELS,
+    best_efforts_table,
+    summarize_weekly,
+    create_mean_max_chart,
+    create_training_load_chart,
+    create_volume_chart,
+    create_velocity_chart
+)
+from views import TIME_RANGES
+
+def render():
+    """
+    Visualizations page: volume, velocity, training load and curves
+    """
+    st.title("Activity Visualizations")
+    
+    if not st.session_state.offline_mode and not st.session_state.authenticated:
+        st.warning("You need to connect your Strava account first or enable offline mode to view visualizations.")
+    elif not st.session_state.user_id:
+        st.warning("No user selected. Please select a user in offline mode or connect to Strava.")
+    else:
+        time_range = st.selectbox("Time range", list(TIME_RANGES.keys()))
+        days = TIME_RANGES[time_range]
+        start_date = datetime.utcnow().date() - timedelta(days=days) if days else None
+        
+        # Daily, weekly or monthly totals depending on the range; memoized per
+        # user and recomputed only after new activities are saved.
+        # Offline mode reads the local snapshot written by the last sync.
+        resolution, rollup = get_rollup_data(
+            st.session_state.user_id,
+            start_date=start_date,
+            use_snapshot=st.session_state.offline_mode
+        )
+        
+        if rollup.empty:
+            st.warning("No activities found. Go to the 'Get Data' page to fetch your activities.")
+        else:
+            summary = summarize_weekly(rollup)
+            
+            # Display summary statistics
+            st.subheader("Summary Statistics")
+            col1, col2, col3, col4 = st.columns(4)
+            
+            with col1:
+                st.metric("Total Activities", summary["total_activities"])
+            
+            with col2:
+                st.metric("Total Distance (km)", round(summary["total_distance_km"], 2))
+            
+            with col3:
+                st.metric("Total Time (hours)", round(summary["total_time_h"], 2))
+            
+            with col4:
+                if summary["avg_velocity_kmh"] is not None:
+                    st.metric("Avg Velocity (km/h)", round(summary["avg_velocity_kmh"], 2))
+            
+            # Select visualization tab
+            st.subheader("Visualizations")
+            tab1, tab2, tab3, tab4 = st.tabs(["Volume", "Velocity", "Training Load", "Curves & Best Efforts"])
+            
+            with tab1:
+                st.plotly_chart(create_volume_chart(rollup, resolution), use_container_width=True)
+            
+            with tab2:
+                st.plotly_chart(create_velocity_chart(rollup, resolution), use_container_width=True)
+            
+            with tab3:
+                try:
+                    load = get_training_load_data(st.session_state.user_id, start_date=start_date)
+                except DatabaseUnavailable:
+                    # Offline mode reads volume from the snapshot; load lives in the database
+                    st.info("Training load needs the database, which is unavailable right now.")
+                else:
+                    st.plotly_chart(create_training_load_chart(load), use_container_width=True)
+                    if not load.empty:
+                        latest = load.iloc[-1]
+                        col1, col2, col3 = st.columns(3)
+                        col1.metric("Fitness (CTL)", round(latest["ctl"], 1))
+                        col2.metric("Fatigue (ATL)", round(latest["atl"], 1))
+                        col3.metric("Form (TSB)", round(latest["tsb"], 1))
+            
+            with tab4:
+                # Built from per-second streams ("Fetch Activity Streams" on the Get Data page)
+                try:
+                    curves = get_curves(st.session_state.user_id, start_date=start_date)
+                except DatabaseUnavailable:
+                    st.info("Curves need the database, which is unavailable right now.")
+                else:
+                    if all(activity_id is None for activity_id in curves["curve_activities"]["speed"]):
+                        st.info("No activity streams stored yet. Fetch them on the 'Get Data' page.")
+                    else:
+                        channel = st.selectbox("Curve", list(CURVE_LABELS), format_func=CURVE_LABELS.get)
+                        st.plotly_chart(create_mean_max_chart(curves, channel), use_container_width=True)
+                        st.subheader("Best Efforts")
+                        st.dataframe(best_efforts_table(curves), use_container_width=True, hide_index=True)